@@ -1,41 +1,600 @@
+import base64
+import hashlib
 import json
+from functools import lru_cache, wraps
 from os import environ as env, urandom
 import re
-from flask import Flask, request, abort, jsonify, render_template, redirect, url_for, session
+from datetime import date
+from flask import Flask, Response, g, request, abort, jsonify, make_response, render_template, redirect, url_for, session, stream_with_context
 from flask_cors import CORS
 from flask_swagger import swagger
-from models import setup_db, Movie, Actor, db
+from sqlalchemy import and_, delete, insert, or_, select, tuple_, update
+from models import setup_db, Movie, Actor, DataVersion, Job, db
 from urllib.parse import quote_plus, urlencode
 from authlib.integrations.flask_client import OAuth
-from auth import requires_auth, AuthError
+from auth import requires_auth, check_permissions, get_verified_payload, AuthError
+from cache import response_cache
+from json_provider import FastJSONProvider
+from metrics import instrument_app, render as render_metrics
+from compression import install_compression
+import jobs
+from jobs import celery_app, init_jobs
+from profiling import install_profiler
+from search import search_index, SEARCHABLE
 from dotenv import find_dotenv, load_dotenv
 
 ENV_FILE = find_dotenv()
 if ENV_FILE:
     load_dotenv(ENV_FILE)
 
+DEFAULT_PAGE_SIZE = int(env.get("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(env.get("MAX_PAGE_SIZE", 500))
+EXPORT_BATCH_SIZE = int(env.get("EXPORT_BATCH_SIZE", 1000))
+BULK_BATCH_SIZE = int(env.get("BULK_BATCH_SIZE", 1000))
+MOVIE_DELETE_POLICIES = ('nullify', 'cascade')
+MOVIE_DELETE_POLICY = env.get("MOVIE_DELETE_POLICY", "nullify")
+
+
+def get_page_args():
+    """
+    Read the `limit` and `after` query parameters.
+
+    Returns None when neither is given, so the caller can fall back to
+    returning the full list for older clients. Aborts with 422 on bad values.
+    """
+    if 'limit' not in request.args and 'after' not in request.args:
+        return None
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', None)
+    if 'limit' not in request.args:
+        limit = DEFAULT_PAGE_SIZE
+    if limit is None or limit < 1 or after == '':
+        abort(422)
+    return min(limit, MAX_PAGE_SIZE), after
+
+
+def get_sort(columns):
+    """
+    Read the `sort` query parameter, e.g. `sort=name` or `sort=-age`.
+
+    Only the names in `columns` (a dict of name to column) are accepted.
+
+    Returns:
+        A (column, descending) tuple, or None when no sort is given.
+    """
+    sort = request.args.get('sort', None)
+    if sort is None:
+        return None
+    descending = sort.startswith('-')
+    column = columns.get(sort.lstrip('-'))
+    if column is None:
+        abort(422)
+    return column, descending
+
+
+def encode_cursor(value, key):
+    if isinstance(value, date):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, key]).encode()).decode()
+
+
+def decode_cursor(cursor, column):
+    """
+    Return the (value, id) pair of a cursor from `encode_cursor`. Aborts
+    with 422 unless the id is an integer and the value is null or of the
+    Python type of `column`, so no other value is bound into the query.
+    """
+    try:
+        value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if type(key) is not int:
+            abort(422)
+        if value is None:
+            return value, key
+        expected = column.type.python_type
+        if expected is date and type(value) is str:
+            return date.fromisoformat(value), key
+        if type(value) is not expected:
+            abort(422)
+        return value, key
+    except (ValueError, TypeError):
+        abort(422)
+
+
+def keyset_paginate(query, column, limit, after=None, sort=None):
+    """
+    Return one page of `query` ordered by `column`, starting after the cursor.
+
+    The page is selected with `column > after ... LIMIT limit + 1` instead of
+    an OFFSET, so it stays stable under concurrent inserts and never scans
+    the skipped rows. `next_cursor` is None on the last page.
+
+    With a `sort` from `get_sort` on another column the rows are ordered by
+    (sort column, `column`) and the cursor is an opaque string holding both
+    values of the last row. NULLs in the sort column sort as the largest
+    value, as Postgres does by default, and get their own branch in the
+    predicate because a comparison with NULL is never true.
+    """
+    sort_column, descending = sort or (column, False)
+    if sort_column.key == column.key:
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                abort(422)
+            query = query.filter(column < after if descending else column > after)
+        order = [column.desc() if descending else column]
+    else:
+        if after is not None:
+            query = query.filter(after_cursor(sort_column, column, descending,
+                                              *decode_cursor(after, sort_column)))
+        order = sort_order(sort_column, column, descending)
+
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = getattr(last, column.key)
+        if sort_column.key != column.key:
+            next_cursor = encode_cursor(getattr(last, sort_column.key), next_cursor)
+    return rows, next_cursor
+
+
+def sort_order(sort_column, column, descending):
+    """ORDER BY clauses for `sort_column` with `column` as tie breaker; NULLs sort as the largest value."""
+    if descending:
+        return [sort_column.desc().nulls_first(), column.desc()]
+    return [sort_column.asc().nulls_last(), column]
+
+
+def after_cursor(sort_column, column, descending, value, key):
+    """Rows that come after (value, key) in the order of `sort_order`."""
+    if value is None:
+        nulls = and_(sort_column.is_(None), column < key if descending else column > key)
+        return or_(nulls, sort_column.is_not(None)) if descending else nulls
+    position = tuple_(sort_column, column)
+    bound = tuple_(value, key)
+    if descending:
+        return position < bound
+    return or_(position > bound, sort_column.is_(None))
+
+
+def sorted_query(query, column, sort):
+    """Order `query` by `sort` (see `get_sort`) with `column` as tie breaker."""
+    if sort is None:
+        return query
+    sort_column, descending = sort
+    return query.order_by(*sort_order(sort_column, column, descending))
+
+
+def get_int_arg(name):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(422)
+
+
+def get_date_arg(name):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(422)
+
+
+def prefix_pattern(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+ACTOR_SORTS = {'id': Actor.id, 'name': Actor.name, 'age': Actor.age}
+MOVIE_SORTS = {'id': Movie.id, 'title': Movie.title, 'release_date': Movie.release_date}
+
+
+def actor_filters():
+    """
+    Build SQL predicates from the actor search parameters: `name` (prefix,
+    case-insensitive), `age_min`, `age_max`, `gender` and `movie_id`.
+    """
+    filters = []
+    if 'name' in request.args:
+        filters.append(Actor.name.ilike(prefix_pattern(request.args['name']), escape='\\'))
+    age_min = get_int_arg('age_min')
+    if age_min is not None:
+        filters.append(Actor.age >= age_min)
+    age_max = get_int_arg('age_max')
+    if age_max is not None:
+        filters.append(Actor.age <= age_max)
+    if 'gender' in request.args:
+        if request.args['gender'] not in Actor.gender.type.enums:
+            abort(422)
+        filters.append(Actor.gender == request.args['gender'])
+    movie_id = get_int_arg('movie_id')
+    if movie_id is not None:
+        filters.append(Actor.movie_id == movie_id)
+    return filters
+
+
+def movie_filters():
+    """
+    Build SQL predicates from the movie search parameters: `title` (prefix,
+    case-insensitive), `released_after` and `released_before` (inclusive,
+    YYYY-MM-DD).
+    """
+    filters = []
+    if 'title' in request.args:
+        filters.append(Movie.title.ilike(prefix_pattern(request.args['title']), escape='\\'))
+    released_after = get_date_arg('released_after')
+    if released_after is not None:
+        filters.append(Movie.release_date >= released_after)
+    released_before = get_date_arg('released_before')
+    if released_before is not None:
+        filters.append(Movie.release_date <= released_before)
+    return filters
+
+
+def ndjson_export(statement, serialize):
+    """
+    Stream the rows of `statement` as newline delimited JSON.
+
+    Rows are fetched from a server-side cursor `EXPORT_BATCH_SIZE` at a time,
+    so memory use does not grow with the size of the table.
+    """
+    def generate():
+        result = db.session.execute(
+            statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for row in result.scalars():
+            yield json.dumps(serialize(row)) + "\n"
+
+    return Response(stream_with_context(generate()),
+                    mimetype="application/x-ndjson")
+
+
+def validate_actor(body):
+    """
+    Return the column values for a new actor from a request body.
+
+    Raises:
+        ValueError: If name, age or gender is missing, gender is unknown,
+            name is not a string or age or movie_id is not an integer.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Actor must be an object")
+    name = body.get('name', None)
+    age = body.get('age', None)
+    gender = body.get('gender', None)
+    if name is None or age is None or gender is None:
+        raise ValueError("name, age and gender are required")
+    if gender not in Actor.gender.type.enums:
+        raise ValueError("gender must be one of " + ", ".join(Actor.gender.type.enums))
+    if not isinstance(name, str):
+        raise ValueError("name must be a string")
+    # type() rather than isinstance() so that true and false are rejected.
+    if type(age) is not int:
+        raise ValueError("age must be an integer")
+    movie_id = body.get('movie_id', None)
+    if movie_id is not None and type(movie_id) is not int:
+        raise ValueError("movie_id must be an integer")
+    return {
+        'name': name,
+        'age': age,
+        'gender': gender,
+        'movie_id': movie_id
+    }
+
+
+def validate_movie(body):
+    """
+    Return the column values for a new movie from a request body.
+
+    Raises:
+        ValueError: If title or release_date is missing, title is not a
+            string or the date is not in YYYY-MM-DD format.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Movie must be an object")
+    title = body.get('title', None)
+    release_date = body.get('release_date', None)
+    if title is None or release_date is None:
+        raise ValueError("title and release_date are required")
+    if not isinstance(title, str):
+        raise ValueError("title must be a string")
+    try:
+        release_date = date.fromisoformat(str(release_date))
+    except ValueError:
+        raise ValueError("release_date must be in YYYY-MM-DD format")
+    return {
+        'title': title,
+        'release_date': release_date
+    }
+
+
+def bulk_create(model, items, validate, batch_size=None):
+    """
+    Validate and insert a list of new rows, `batch_size` rows per transaction.
+
+    Each batch is written with one multi-row INSERT and committed on its own,
+    so a failing batch is rolled back without losing the others.
+
+    Returns:
+        A list with one result dict per item, in request order.
+    """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, validate(item)))
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'invalid', 'error': str(e)}
+
+    if model is Actor:
+        # An unknown movie would fail the foreign key and the whole batch.
+        movie_ids = {values['movie_id'] for _, values in valid} - {None}
+        known = set(db.session.scalars(select(Movie.id).where(Movie.id.in_(movie_ids))))
+        for index, values in valid:
+            if values['movie_id'] is not None and values['movie_id'] not in known:
+                results[index] = {'index': index, 'status': 'invalid',
+                                  'error': "movie_id does not name a movie"}
+        valid = [(index, values) for index, values in valid if results[index] is None]
+
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start:start + batch_size]
+        try:
+            ids = db.session.scalars(statement, [values for _, values in batch]).all()
+            if model is Actor:
+                Movie.refresh_casts(values['movie_id'] for _, values in batch)
+            DataVersion.bump(model.__tablename__)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for index, _ in batch:
+                results[index] = {'index': index, 'status': 'failed',
+                                  'error': e.__class__.__name__}
+            continue
+        kind, field = SEARCHABLE[model.__tablename__]
+        for (index, values), id in zip(batch, ids):
+            results[index] = {'index': index, 'status': 'created', 'id': id}
+            search_index.add(kind, id, values[field])
+    return results
+
+
+def bulk_items():
+    """
+    Return the request body of a bulk create. Aborts with 422 unless it is a
+    non-empty JSON array.
+    """
+    items = request.get_json()
+    if not isinstance(items, list) or not items:
+        abort(422)
+    return items
+
+
+def bulk_summary(results):
+    created = sum(1 for result in results if result['status'] == 'created')
+    return {
+        'success': created == len(results),
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }
+
+
+def bulk_response(items, model, validate):
+    return jsonify(bulk_summary(bulk_create(model, items, validate)))
+
+
+def get_delete_policy():
+    """
+    Read the `policy` query parameter of a movie delete: `nullify` keeps the
+    movie's actors without a movie, `cascade` deletes them. Defaults to
+    `MOVIE_DELETE_POLICY`; aborts with 422 on other values.
+    """
+    policy = request.args.get('policy', MOVIE_DELETE_POLICY)
+    if policy not in MOVIE_DELETE_POLICIES:
+        abort(422)
+    return policy
+
+
+def remove_movie(movie_id, policy=None):
+    """
+    Delete a movie and apply `policy` (see `get_delete_policy`) to its
+    actors. The actors are updated or deleted with one set-based statement
+    instead of being loaded one by one, so the time the movie row stays
+    locked does not grow with the size of its cast.
+
+    Returns:
+        A dict with the movie's title and the number of actors nullified or
+        deleted, or None if there is no such movie.
+    """
+    policy = policy or MOVIE_DELETE_POLICY
+    movie = db.session.execute(select(Movie.title).where(Movie.id == movie_id)
+                               .with_for_update()).first()
+    if movie is None:
+        return None
+    actors = Actor.movie_id == movie_id
+    if policy == 'cascade':
+        actor_ids = db.session.scalars(delete(Actor).where(actors).returning(Actor.id)).all()
+        count = len(actor_ids)
+    else:
+        actor_ids = []
+        count = db.session.execute(update(Actor).where(actors).values(movie_id=None)).rowcount
+    db.session.execute(delete(Movie).where(Movie.id == movie_id))
+    DataVersion.bump('movies', 'actors')
+    db.session.commit()
+    search_index.remove('movie', movie_id)
+    for actor_id in actor_ids:
+        search_index.remove('actor', actor_id)
+    return {'title': movie.title, 'actors': count}
+
+
+# Background jobs, queued by queue_job and run by jobs.run
+
+@jobs.handler('import:actors', 'post:actors')
+def import_actors(items):
+    return bulk_summary(bulk_create(Actor, items, validate_actor))
+
+
+@jobs.handler('import:movies', 'post:movies')
+def import_movies(items):
+    return bulk_summary(bulk_create(Movie, items, validate_movie))
+
+
+@jobs.handler('delete:movie', 'delete:movies')
+def delete_movie_job(payload):
+    deleted = remove_movie(payload['movie_id'], payload.get('policy'))
+    return {'movie_id': payload['movie_id'], 'policy': payload.get('policy'),
+            'deleted': deleted is not None,
+            'actors': deleted['actors'] if deleted is not None else 0}
+
+
+@jobs.handler('rebuild:search', 'rebuild:search')
+def rebuild_search(payload):
+    search_index.reindex()
+
+
+def prefers_async():
+    """True when the request sends `Prefer: respond-async` (RFC 7240)."""
+    preferences = request.headers.get('Prefer', '').split(',')
+    return 'respond-async' in (preference.strip().lower() for preference in preferences)
+
+
+def queue_job(kind, payload, token):
+    """
+    Queue a background job and answer 202 Accepted with the job and its
+    status URL. A retried request with the same `Idempotency-Key` header
+    gets the job queued by the first one.
+
+    Raises:
+        409: If the Idempotency-Key was used for a different request.
+        422: If the Idempotency-Key is longer than 255 characters.
+    """
+    key = request.headers.get('Idempotency-Key')
+    if key is not None and not 0 < len(key) <= 255:
+        abort(422)
+    try:
+        job, created = jobs.enqueue(kind, payload, token.get('sub'), key)
+    except jobs.IdempotencyConflict:
+        abort(409)
+    response = jsonify({
+        'success': True,
+        'job': job.format()
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('get_job', job_id=job.id)
+    return response
+
+
+def format_movies(movies):
+    """
+    Build the `Movie.format()` dicts for (title, release_date, cast_names)
+    rows. The cast comes from the movie's own `cast_names` read model, so no
+    actor rows are read.
+    """
+    return [{
+        'title': movie.title,
+        'release_date': movie.release_date,
+        'actors': movie.cast_names
+    } for movie in movies]
+
+
+def conditional(*resources):
+    """
+    Add ETag and Last-Modified headers to a GET view and answer
+    If-None-Match / If-Modified-Since with 304 Not Modified.
+
+    The validators come from the `DataVersion` rows of `resources`, so the
+    view only runs when one of those tables changed since the client's copy.
+    Use it below `requires_auth` so permissions are still checked first.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            versions = DataVersion.current(*resources)
+            g.data_versions = versions
+            tag = ";".join(f"{name}={versions[name][0]}" for name in resources)
+            tag += "?" + request.query_string.decode()
+            etag = hashlib.sha1(tag.encode()).hexdigest()[:20]
+            last_modified = max((updated_at for _, updated_at in versions.values()
+                                 if updated_at is not None), default=None)
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (last_modified is not None
+                                and request.if_modified_since is not None
+                                and last_modified <= request.if_modified_since)
+
+            if not_modified:
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
 # create and configure the app
 def create_app(test_config=None):
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     app.secret_key = urandom(24)
     if test_config is None:
         setup_db(app)
     CORS(app)
     cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
     oauth = OAuth(app)
+    # after_request hooks run in reverse: a profile report replaces the body
+    # before it is compressed, and metrics record the compressed size.
+    instrument_app(app)
+    install_compression(app)
+    install_profiler(app)
+    init_jobs(app)
 
+    # Registered on first login/callback, so booting a worker never touches
+    # Auth0; authlib fetches the OpenID metadata on the first authorize call.
+    @lru_cache(maxsize=None)
+    def auth0_client():
+        return oauth.register(
+            "auth0",
+            client_id=env.get("AUTH0_CLIENT_ID"),
+            client_secret=env.get("AUTH0_CLIENT_SECRET"),
+            authorize_url=f'https://{env.get("AUTH0_DOMAIN")}/authorize?audience={env.get("AUTH0_AUDIENCE")}',
+            server_metadata_url=f'https://{env.get("AUTH0_DOMAIN")}/.well-known/openid-configuration',
+        )
 
-    oauth.register(
-        "auth0",
-        client_id=env.get("AUTH0_CLIENT_ID"),
-        client_secret=env.get("AUTH0_CLIENT_SECRET"),
-        authorize_url=f'https://{env.get("AUTH0_DOMAIN")}/authorize?audience={env.get("AUTH0_AUDIENCE")}',
-        server_metadata_url=f'https://{env.get("AUTH0_DOMAIN")}/.well-known/openid-configuration',
-    )
+    # The spec walks every view docstring, so it is built once on first use.
+    @lru_cache(maxsize=None)
+    def api_spec():
+        return swagger(app)
 
     @app.route("/api/spec")
     def spec():
-        return render_template("api_doc.html", spec=swagger(app))
+        return render_template("api_doc.html", spec=api_spec())
+
+    @app.route("/metrics")
+    def metrics():
+        """
+        Prometheus metrics: request latency, status codes and sizes per
+        route, SQL statements per request, JWT verification time, cache hit
+        rates and database pool usage.
+        """
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
 
     # Controllers API
     @app.route("/")
@@ -49,20 +608,22 @@ def create_app(test_config=None):
 
     @app.route("/callback", methods=["GET", "POST"])
     def callback():
-        if oauth.auth0:
-            token = oauth.auth0.authorize_access_token()
+        auth0 = auth0_client()
+        if auth0:
+            token = auth0.authorize_access_token()
             session["user"] = token
         return redirect("/")
 
 
     @app.route("/login")
     def login():
-        if oauth.auth0:
-            return oauth.auth0.authorize_redirect(
+        auth0 = auth0_client()
+        if auth0:
+            return auth0.authorize_redirect(
                 redirect_uri=url_for("callback", _external=True)
             )
         else:
-            # Handle the case when oauth.auth0 is None
+            # Handle the case when the auth0 client is None
             return "OAuth provider not configured."
 
 
@@ -85,18 +646,49 @@ def create_app(test_config=None):
 
     @app.route('/actors')
     @requires_auth('get:actors')
+    @conditional('actors')
+    @response_cache.cached('actors')
     def get_actors(token):
         """
         Retrieve all actors from the database and return them as a JSON response.
+
+        Pass `limit` and optionally `after` (the `next_cursor` of the previous
+        page) to page through the actors by id. Without them the full list is
+        returned.
+
+        The list can be narrowed with `name` (prefix), `age_min`, `age_max`,
+        `gender` and `movie_id`, and ordered with `sort` (`id`, `name` or
+        `age`, prefixed with `-` for descending). Filters run in SQL.
         ---
         Returns:
             A JSON response containing the list of actors and a success status.
         """
-        actors = Actor.query.all()
-        actors = [actor.name for actor in actors]
+        filters = actor_filters()
+        sort = get_sort(ACTOR_SORTS)
+        page = get_page_args()
+        if page is None and not filters and sort is None:
+            actors = db.session.execute(select(Actor.name)).scalars().all()
+            return jsonify({
+                'success': True,
+                'actors': actors
+            })
+
+        columns = [Actor.id, Actor.name]
+        if sort is not None and sort[0] is Actor.age:
+            columns.append(Actor.age)
+        query = db.session.query(*columns).filter(*filters)
+        if page is None:
+            actors = sorted_query(query, Actor.id, sort).all()
+            return jsonify({
+                'success': True,
+                'actors': [actor.name for actor in actors]
+            })
+
+        actors, next_cursor = keyset_paginate(query, Actor.id, *page, sort=sort)
         return jsonify({
             'success': True,
-            'actors': actors
+            'actors': [actor.name for actor in actors],
+            'next_cursor': next_cursor
         })
 
 
@@ -121,22 +713,13 @@ def create_app(test_config=None):
         try:
             body = request.get_json()
 
-            name = body.get('name', None)
-            age = body.get('age', None)
-            gender = body.get('gender', None)
-            movie_id = body.get('movie_id', None)
-            
-            if name is None or age is None or gender is None:
-                abort(422)
+            new_actor = Actor(**validate_actor(body))
 
-            new_actor = Actor()
-            new_actor.name = name
-            new_actor.age = age
-            new_actor.gender = gender
-            new_actor.movie_id = movie_id
-            
-            db.session.add(new_actor) 
-            db.session.commit()  
+            db.session.add(new_actor)
+            Movie.refresh_casts([new_actor.movie_id])
+            DataVersion.bump('actors')
+            db.session.commit()
+            search_index.add('actor', new_actor.id, new_actor.name)
             return jsonify({
                 'success': True,
                 'created': "New Actor is Created with Name " + str(new_actor.name)
@@ -146,11 +729,41 @@ def create_app(test_config=None):
             db.session.rollback()
             abort(422)
         
+    @app.route('/actors/bulk', methods=['POST'])
+    @requires_auth('post:actors')
+    def create_actors_bulk(token):
+        """
+        Create many actors in one request.
+
+        Takes a JSON array of actors, each validated like `POST /actors`.
+        Valid actors are inserted in batches of `BULK_BATCH_SIZE`, one
+        transaction per batch.
+
+        With a `Prefer: respond-async` header the import runs as a
+        background job and the response is 202 Accepted with the job; its
+        result at GET /jobs/<id> is the body described below.
+        ---
+        tags:
+            - Actors
+        Returns:
+            A JSON response with the number of created and failed actors and
+            one result per item with its status and new id or error.
+        Raises:
+            422: If the body is not a non-empty array.
+        """
+        items = bulk_items()
+        if prefers_async():
+            return queue_job('import:actors', items, token)
+        return bulk_response(items, Actor, validate_actor)
+
     @app.route('/actors/<int:actor_id>', methods=['PATCH'])
     @requires_auth('patch:actors')
     def update_actor(token, actor_id):
         """
         Update an actor's information.
+
+        `name`, `age` and `movie_id` can be changed; a `movie_id` of null
+        removes the actor from their movie.
         ---
         Args:
             actor_id (int): The ID of the actor to be updated.
@@ -160,17 +773,32 @@ def create_app(test_config=None):
 
         Raises:
             404: If the actor with the given ID does not exist in the database.
+            422: If the body is not a JSON object or `movie_id` does not name
+                an existing movie.
         """
         actor = Actor.query.get(actor_id)
         if actor is None:
             abort(404)
+        body = request.get_json()
+        if not isinstance(body, dict):
+            abort(422)
+        movie_id = body.get('movie_id', actor.movie_id)
+        if movie_id is not None and (type(movie_id) is not int
+                                     or db.session.get(Movie, movie_id) is None):
+            abort(422)
         try:
-            if 'name' in request.get_json():
-                actor.name = request.get_json()['name']
-            if 'age' in request.get_json():
-                actor.age = request.get_json()['age']
-            
+            casts = {actor.movie_id, movie_id}
+            if 'name' in body:
+                actor.name = body['name']
+            if 'age' in body:
+                actor.age = body['age']
+            actor.movie_id = movie_id
+
+            if 'name' in body or 'movie_id' in body:
+                Movie.refresh_casts(casts)
+            DataVersion.bump('actors')
             db.session.commit()
+            search_index.add('actor', actor.id, actor.name)
             return jsonify({
                 'success': True,
                 'updated': "Actor '" + str(actor.name)+"' is Updated"
@@ -199,7 +827,10 @@ def create_app(test_config=None):
         if actor is None:
             abort(404)
         db.session.delete(actor)
+        Movie.refresh_casts([actor.movie_id])
+        DataVersion.bump('actors')
         db.session.commit()
+        search_index.remove('actor', actor_id)
         
         return jsonify({
             'success': True,
@@ -208,21 +839,42 @@ def create_app(test_config=None):
 
     @app.route('/movies')
     @requires_auth('get:movies')
+    @conditional('movies', 'actors')
+    @response_cache.cached('movies', 'actors')
     def get_movies(token):
         """
         Retrieves all movies from the database.
 
+        Only the returned columns are selected, as plain rows, and each
+        movie's cast is read from its precomputed `cast_names`, so the list
+        is served by one scan of the movies table. Pass `limit` and
+        optionally `after` to page through the movies by id, as for `/actors`.
+
+        The list can be narrowed with `title` (prefix), `released_after` and
+        `released_before`, and ordered with `sort` (`id`, `title` or
+        `release_date`, prefixed with `-` for descending).
+
         Returns:
             A JSON response containing the list of movies and a success flag.
         """
-        movies = Movie.query.all()
-        movies = [movie.format() for movie in movies]
+        filters = movie_filters()
+        sort = get_sort(MOVIE_SORTS)
+        query = (db.session.query(Movie.id, Movie.title, Movie.release_date,
+                                  Movie.cast_names)
+                 .filter(*filters))
+        page = get_page_args()
+        if page is None:
+            movies = sorted_query(query, Movie.id, sort).all()
+            return jsonify({
+                'success': True,
+                'movies': format_movies(movies)
+            })
 
-        if movies is None:
-            abort(404)
+        movies, next_cursor = keyset_paginate(query, Movie.id, *page, sort=sort)
         return jsonify({
             'success': True,
-            'movies': movies
+            'movies': format_movies(movies),
+            'next_cursor': next_cursor
         })
         
     @app.route('/movies', methods=['POST'])
@@ -245,18 +897,12 @@ def create_app(test_config=None):
         try:
             body = request.get_json()
 
-            title = body.get('title', None)
-            release_date = body.get('release_date', None)
+            new_movie = Movie(**validate_movie(body))
 
-            if title is None or release_date is None:
-                abort(422)
-            
-            new_movie = Movie()
-            new_movie.title=title
-            new_movie.release_date=release_date
-            
             db.session.add(new_movie)
+            DataVersion.bump('movies')
             db.session.commit()
+            search_index.add('movie', new_movie.id, new_movie.title)
 
             return jsonify({
                 'success': True,
@@ -267,6 +913,32 @@ def create_app(test_config=None):
             db.session.rollback()
             abort(422)
         
+    @app.route('/movies/bulk', methods=['POST'])
+    @requires_auth('post:movies')
+    def create_movies_bulk(token):
+        """
+        Create many movies in one request.
+
+        Takes a JSON array of movies, each validated like `POST /movies`.
+        Valid movies are inserted in batches of `BULK_BATCH_SIZE`, one
+        transaction per batch.
+
+        With a `Prefer: respond-async` header the import runs as a
+        background job and the response is 202 Accepted with the job; its
+        result at GET /jobs/<id> is the body described below.
+
+        Returns:
+            A JSON response with the number of created and failed movies and
+            one result per item with its status and new id or error.
+
+        Raises:
+            422: If the body is not a non-empty array.
+        """
+        items = bulk_items()
+        if prefers_async():
+            return queue_job('import:movies', items, token)
+        return bulk_response(items, Movie, validate_movie)
+
     @app.route('/movies/<int:movie_id>', methods=['PATCH'])
     @requires_auth('patch:movies')
     def update_movie(token, movie_id):
@@ -298,7 +970,9 @@ def create_app(test_config=None):
             if 'release_date' in request.get_json():
                 movie.release_date = request.get_json()['release_date']
 
-            db.session.commit() 
+            DataVersion.bump('movies')
+            db.session.commit()
+            search_index.add('movie', movie.id, movie.title)
             return jsonify({
                 'success': True,
                 'updated': "Movie '" + str(movie.title)+"' is Updated"
@@ -318,19 +992,124 @@ def create_app(test_config=None):
 
         Returns:
             dict: A JSON response indicating the success of the deletion and the ID of the deleted movie.
+
+        The `policy` query parameter decides what happens to the movie's
+        actors: `nullify` keeps them without a movie, `cascade` deletes
+        them. It defaults to `MOVIE_DELETE_POLICY` (`nullify`).
+
+        With a `Prefer: respond-async` header the movie is deleted by a
+        background job and the response is 202 Accepted with the job.
         """
-        movie = Movie.query.get(movie_id)
-        if movie is None:
+        policy = get_delete_policy()
+        if prefers_async():
+            if db.session.get(Movie, movie_id) is None:
+                abort(404)
+            return queue_job('delete:movie', {'movie_id': movie_id, 'policy': policy}, token)
+
+        deleted = remove_movie(movie_id, policy)
+        if deleted is None:
             abort(404)
-        
-        db.session.delete(movie)
-        db.session.commit()
-        
+
+        return jsonify({
+            'success': True,
+            'deleted': "Movie '"+str(deleted['title'])+"' is Deleted"
+        })
+
+    @app.route('/search/rebuild', methods=['POST'])
+    @requires_auth('rebuild:search')
+    def rebuild_search_index(token):
+        """
+        Rebuild the search index in a background job: the GIN indexes on
+        Postgres, the in-memory index of the process running the job
+        otherwise.
+        ---
+        Returns:
+            202 Accepted with the queued job.
+        """
+        return queue_job('rebuild:search', {}, token)
+
+    @app.route('/jobs/<job_id>')
+    def get_job(job_id):
+        """
+        Status of a background job: queued, running, succeeded or failed,
+        with its result or error once it has finished.
+
+        Needs the permission of the request that queued the job.
+        ---
+        Returns:
+            A JSON response with the job.
+        Raises:
+            404: If there is no such job.
+        """
+        payload = get_verified_payload()
+        job = db.session.get(Job, job_id)
+        if job is None:
+            abort(404)
+        check_permissions(jobs.HANDLERS[job.kind][0], payload)
+        return jsonify({
+            'success': True,
+            'job': job.format()
+        })
+
+    @app.route('/search')
+    @requires_auth('get:actors')
+    def search(token):
+        """
+        Search actor names and movie titles.
+
+        Every word of `q` must match the start of a word in the name or
+        title. Hits are ranked best first and paged with `limit` (default 20)
+        and `page` (starting at 1). Needs both get:actors and get:movies.
+
+        Returns:
+            A JSON response with the hits (type, id, text and rank), the page
+            number and whether there are more hits.
+
+        Raises:
+            422: If `q` is missing or the paging parameters are invalid.
+        """
+        check_permissions('get:movies', token)
+        q = request.args.get('q', '').strip()
+        limit = request.args.get('limit', 20, type=int)
+        page = request.args.get('page', 1, type=int)
+        if not q or limit < 1 or page < 1:
+            abort(422)
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        hits = search_index.search(q, limit + 1, (page - 1) * limit)
         return jsonify({
             'success': True,
-            'deleted': "Movie '"+str(movie.title)+"' is Deleted"
+            'results': hits[:limit],
+            'page': page,
+            'has_more': len(hits) > limit
         })
 
+    @app.route('/export/actors.ndjson')
+    @requires_auth('get:actors')
+    def export_actors(token):
+        """
+        Stream every actor as one JSON object per line.
+
+        Returns:
+            An application/x-ndjson response with the id, name, age, gender
+            and movie_id of each actor, ordered by id.
+        """
+        return ndjson_export(select(Actor).order_by(Actor.id),
+                             lambda actor: actor.format())
+
+    @app.route('/export/movies.ndjson')
+    @requires_auth('get:movies')
+    def export_movies(token):
+        """
+        Stream every movie and its cast as one JSON object per line.
+
+        Returns:
+            An application/x-ndjson response with the id, title, ISO release
+            date and actor names of each movie, ordered by id.
+        """
+        return ndjson_export(select(Movie).order_by(Movie.id),
+                             lambda movie: movie.export())
+
     @app.errorhandler(422)
     def unprocessable(error):
         return jsonify({
@@ -357,6 +1136,14 @@ def create_app(test_config=None):
             "message": error.error
         }), error.status_code
     
+    @app.errorhandler(409)
+    def conflict(error):
+        return jsonify({
+            "success": False,
+            "error": 409,
+            "message": "Conflict"
+        }), 409
+
     @app.errorhandler(405)
     def not_allowed(error):
         return jsonify({
@@ -370,5 +1157,5 @@ def create_app(test_config=None):
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    app.run(host='0.0.0.0', port=8080, debug=env.get('FLASK_DEBUG') == '1')
 
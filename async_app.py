@@ -0,0 +1,42 @@
+"""
+Async serving mode.
+
+Runs the same routes from `create_app` on eventlet green threads, so one
+worker keeps serving other requests while a request waits on Postgres or on
+the Auth0 JWKS fetch. The standard library is monkey patched before the app
+is imported (which makes `urlopen` in `auth.fetch_auth0_jwks` and the
+background JWKS refresh cooperative) and psycopg2 is switched to its
+asynchronous protocol through a wait callback that yields to the eventlet hub.
+
+    gunicorn -k eventlet -w 2 --worker-connections 500 async_app:app
+
+Raise DB_POOL_SIZE / DB_MAX_OVERFLOW to match the number of requests a
+worker should have in flight at once. The sync mode (`gunicorn app:app`) is
+unchanged.
+"""
+import eventlet
+
+eventlet.monkey_patch()
+
+import psycopg2
+from psycopg2 import extensions
+from eventlet.hubs import trampoline
+
+
+def eventlet_wait_callback(conn, timeout=-1):
+    """Wait for a psycopg2 connection without blocking the other green threads."""
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError("Bad result from poll: %r" % state)
+
+
+extensions.set_wait_callback(eventlet_wait_callback)
+
+from app import app  # noqa: E402
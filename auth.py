@@ -1,17 +1,31 @@
+import hashlib
 import json
-from flask import request, abort
-from functools import wraps
-from urllib.request import urlopen
+import logging
+import os
+import threading
+import time
 from flask import request, abort
 from functools import wraps
 from jose import jwt, exceptions
+from collections import OrderedDict
 from urllib.request import urlopen
+from metrics import CACHE_REQUESTS, JWT_VERIFY_SECONDS
 
 
 AUTH0_DOMAIN = 'dev-lcdbke2zg51u1eut.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'http://127.0.0.1:5000/actors'
 
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 600))
+JWKS_MIN_REFETCH_INTERVAL = int(os.environ.get('JWKS_MIN_REFETCH_INTERVAL', 30))
+JWKS_FETCH_TIMEOUT = int(os.environ.get('JWKS_FETCH_TIMEOUT', 5))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+# A local JWKS (e.g. file:///path/jwks.json from `python local_auth.py`) can
+# stand in for the Auth0 tenant in offline runs.
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+logger = logging.getLogger(__name__)
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -23,6 +37,191 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## JWKS Key Store
+
+def fetch_auth0_jwks():
+    jsonurl = urlopen(JWKS_URL, timeout=JWKS_FETCH_TIMEOUT)
+    return json.loads(jsonurl.read())
+
+
+class JWKSKeyStore:
+    '''
+    In-process cache of the signing keys published by the identity provider.
+
+    Keys are parsed once and indexed by `kid`. Once `ttl` seconds have passed
+    the keys are refreshed on a background thread while the current ones keep
+    being served. An unknown `kid` triggers one forced refetch (at most every
+    `min_refetch_interval` seconds) to pick up rotated keys, and a failed
+    fetch leaves the previously loaded keys in place.
+
+    `fetcher` is any callable returning a JWKS document as a dict, which
+    lets tests point the store at a local stand-in.
+    '''
+
+    def __init__(self, fetcher=fetch_auth0_jwks, ttl=JWKS_CACHE_TTL,
+                 min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL,
+                 background=True):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.background = background
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @staticmethod
+    def parse_keys(jwks):
+        keys = {}
+        for key in jwks.get('keys', []):
+            if 'kid' not in key:
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use', 'sig'),
+                'n': key['n'],
+                'e': key['e']
+            }
+        return keys
+
+    def refresh(self):
+        '''Fetch the JWKS document and swap in the parsed keys.
+
+        Returns True on success. On failure the old keys are kept.
+        '''
+        self._last_attempt = time.monotonic()
+        try:
+            keys = self.parse_keys(self.fetcher())
+        except Exception:
+            logger.warning('JWKS refresh failed, serving cached keys',
+                           exc_info=True)
+            return False
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='jwks-refresh', daemon=True).start()
+
+    def _is_stale(self):
+        return (self._fetched_at is None
+                or time.monotonic() - self._fetched_at >= self.ttl)
+
+    def _may_refetch(self):
+        return (self._last_attempt is None
+                or time.monotonic() - self._last_attempt >= self.min_refetch_interval)
+
+    def get_key(self, kid):
+        '''Return the RSA key dict for `kid`, or None if it is unknown.'''
+        if not self._keys:
+            if self._may_refetch():
+                self.refresh()
+        elif self._is_stale() and self._may_refetch():
+            if self.background:
+                self._refresh_in_background()
+            else:
+                self.refresh()
+
+        key = self._keys.get(kid)
+        if key is None and self._keys and self._may_refetch():
+            # Unknown kid: the provider may have rotated its keys.
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = None
+
+
+jwks_store = JWKSKeyStore()
+
+
+## Verified Token Cache
+
+class VerifiedTokenCache:
+    '''
+    Bounded LRU cache of verified JWT payloads keyed by a SHA-256 digest of
+    the raw bearer token, so repeated requests with the same access token
+    skip signature and claims verification.
+
+    Entries expire at the token's own `exp` claim; tokens without one are
+    never cached. Cached permission lists are stored as frozensets.
+    '''
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                CACHE_REQUESTS.labels('token', 'miss').inc()
+                return None
+            expires_at, payload = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                CACHE_REQUESTS.labels('token', 'miss').inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_REQUESTS.labels('token', 'hit').inc()
+            return payload
+
+    def put(self, token, payload):
+        if self.maxsize <= 0 or 'exp' not in payload:
+            return payload
+        payload = dict(payload)
+        if 'permissions' in payload:
+            payload['permissions'] = frozenset(payload['permissions'])
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (payload['exp'], payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = VerifiedTokenCache()
+
+
 ## Auth Header
 
 def get_token_auth_header():
@@ -72,25 +271,14 @@ def check_permissions(permission, payload):
     return True
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -124,17 +312,26 @@ def verify_decode_jwt(token):
         'description': 'Unable to find the appropriate key.'
     }, 400)
 
+def get_verified_payload():
+    '''Return the verified payload of the request's bearer token.'''
+    token = get_token_auth_header()
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            with JWT_VERIFY_SECONDS.time():
+                payload = verify_decode_jwt(token)
+            payload = token_cache.put(token, payload)
+        except:
+            abort(401)
+    return payload
+
+
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
 
-            token = get_token_auth_header()
-            try:
-                payload = verify_decode_jwt(token)
-            except:
-                abort(401)
-
+            payload = get_verified_payload()
             check_permissions(permission, payload)
 
             return f(payload, *args, **kwargs)
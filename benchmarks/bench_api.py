@@ -0,0 +1,319 @@
+"""
+Load-test every API route (except the Auth0 login redirects) against a
+synthetic dataset, with no Auth0 tenant involved.
+
+Seeds actors and movies at the chosen scale into a fresh database, mints
+access tokens with a local RSA key whose JWKS the app is pointed at, serves
+the app on a local threaded server and drives one route at a time with
+`--concurrency` clients for `--duration` seconds. For each route it reports
+p50/p95/p99 latency, requests per second, errors and SQL statements per
+request, and writes them as sorted JSON so runs can be diffed across commits.
+
+    python benchmarks/bench_api.py --scale 100k --output bench/100k.json
+    python benchmarks/bench_api.py --scale 100k --compare bench/100k.json
+
+Without `--database-url` a temporary SQLite file is used. With a Postgres URL
+the actors, movies and data_versions tables are dropped and recreated.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import requests
+from sqlalchemy import event, insert, select
+from werkzeug.serving import make_server
+from app import create_app
+from cache import response_cache
+from local_auth import LocalSigner
+from models import setup_db, db, Actor, Movie
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {'1k': 1000, '100k': 100000, '1M': 1000000}
+SEED_BATCH_SIZE = 10000
+
+PERMISSIONS = [
+    'get:actors', 'get:movies', 'post:actors', 'post:movies',
+    'patch:actors', 'patch:movies', 'delete:actors', 'delete:movies'
+]
+
+
+## Dataset
+
+def seed(actors, movies):
+    start = date(1950, 1, 1)
+    for offset in range(0, movies, SEED_BATCH_SIZE):
+        db.session.execute(insert(Movie), [
+            {'title': f'Movie {i}', 'release_date': start + timedelta(days=i % 25000)}
+            for i in range(offset, min(offset + SEED_BATCH_SIZE, movies))
+        ])
+    for offset in range(0, actors, SEED_BATCH_SIZE):
+        db.session.execute(insert(Actor), [
+            {'name': f'Actor {i}', 'age': 18 + i % 70,
+             'gender': 'Male' if i % 2 else 'Female', 'movie_id': i % movies + 1}
+            for i in range(offset, min(offset + SEED_BATCH_SIZE, actors))
+        ])
+    db.session.commit()
+    Movie.rebuild_casts(SEED_BATCH_SIZE)
+
+
+def actor_ids():
+    return db.session.execute(select(Actor.id).order_by(Actor.id.desc())).scalars().all()
+
+
+def movie_ids_without_cast():
+    cast = select(Actor.movie_id).where(Actor.movie_id.is_not(None))
+    return db.session.execute(select(Movie.id).where(Movie.id.not_in(cast))
+                              .order_by(Movie.id.desc())).scalars().all()
+
+
+## Routes
+
+def routes(actors, movies):
+    '''
+    name -> (method, path, body, ids). `path` and `body` take a random
+    generator (and an id popped from `ids()` for deletes).
+    '''
+    actor = lambda rng: {'name': f'Bench Actor {rng.randrange(10 ** 9)}',
+                         'age': rng.randrange(18, 90), 'gender': 'Female'}
+    movie = lambda rng: {'title': f'Bench Movie {rng.randrange(10 ** 9)}',
+                         'release_date': '2001-02-03'}
+    return {
+        'GET /': ('GET', lambda rng: '/', None, None),
+        'GET /api/spec': ('GET', lambda rng: '/api/spec', None, None),
+        'GET /metrics': ('GET', lambda rng: '/metrics', None, None),
+        'GET /actors': ('GET', lambda rng: '/actors', None, None),
+        'GET /actors?limit': ('GET', lambda rng: '/actors?limit=50', None, None),
+        'GET /actors?filter': (
+            'GET', lambda rng: f'/actors?name=Actor {rng.randrange(10)}&age_min=30'
+                               f'&sort=-age&limit=50', None, None),
+        'GET /movies': ('GET', lambda rng: '/movies', None, None),
+        'GET /movies?limit': ('GET', lambda rng: '/movies?limit=50', None, None),
+        'GET /search': ('GET', lambda rng: f'/search?q=actor {rng.randrange(actors)}',
+                        None, None),
+        'GET /export/actors.ndjson': ('GET', lambda rng: '/export/actors.ndjson',
+                                      None, None),
+        'GET /export/movies.ndjson': ('GET', lambda rng: '/export/movies.ndjson',
+                                      None, None),
+        'POST /actors': ('POST', lambda rng: '/actors', actor, None),
+        'POST /actors/bulk': ('POST', lambda rng: '/actors/bulk',
+                              lambda rng: [actor(rng) for _ in range(100)], None),
+        'PATCH /actors': ('PATCH', lambda rng: f'/actors/{rng.randrange(actors) + 1}',
+                          lambda rng: {'age': rng.randrange(18, 90)}, None),
+        'POST /movies': ('POST', lambda rng: '/movies', movie, None),
+        'POST /movies/bulk': ('POST', lambda rng: '/movies/bulk',
+                              lambda rng: [movie(rng) for _ in range(100)], None),
+        'PATCH /movies': ('PATCH', lambda rng: f'/movies/{rng.randrange(movies) + 1}',
+                          lambda rng: {'title': f'Movie {rng.randrange(movies)}'}, None),
+        'DELETE /actors': ('DELETE', lambda rng, id: f'/actors/{id}', None, actor_ids),
+        'DELETE /movies': ('DELETE', lambda rng, id: f'/movies/{id}', None,
+                           movie_ids_without_cast),
+    }
+
+
+## Load
+
+class StatementCounter:
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+
+def drive(base_url, token, route, args, seed_value):
+    method, path, body, ids = route
+    pool = deque(ids()) if ids else None
+    headers = {'Authorization': f'Bearer {token}'}
+    deadline = time.monotonic() + args.duration
+
+    def client(number):
+        rng = random.Random(seed_value * 1000 + number)
+        session = requests.Session()
+        latencies, errors = [], 0
+        while time.monotonic() < deadline:
+            if pool is not None:
+                try:
+                    url = base_url + path(rng, pool.popleft())
+                except IndexError:
+                    break
+            else:
+                url = base_url + path(rng)
+            payload = body(rng) if body else None
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, headers=headers, timeout=120,
+                                           json=payload)
+                response.content
+                if response.status_code != 200:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        return latencies, errors
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(client, range(args.concurrency)))
+    elapsed = time.monotonic() - started
+    latencies = sorted(l for result, _ in results for l in result)
+    return latencies, sum(e for _, e in results), elapsed
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+## Report
+
+def print_report(report, previous=None):
+    print(f'{"route":<28}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+          f'{"errors":>8}{"queries":>9}' + (f'{"req/s was":>11}{"p95 was":>10}'
+                                            if previous else ''))
+    for name, result in report['routes'].items():
+        line = (f'{name:<28}{result["rps"]:>10.1f}{result["p50_ms"]:>10.1f}'
+                f'{result["p95_ms"]:>10.1f}{result["p99_ms"]:>10.1f}'
+                f'{result["errors"]:>8}{result["queries_per_request"]:>9.1f}')
+        old = (previous or {}).get('routes', {}).get(name)
+        if old:
+            line += f'{old["rps"]:>11.1f}{old["p95_ms"]:>10.1f}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', default='1k', choices=list(SCALES),
+                        help='number of actors; there are ten times fewer movies')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--routes', nargs='+', default=None,
+                        help='only run these routes, e.g. "GET /movies"')
+    parser.add_argument('--response-cache', action='store_true',
+                        help='keep the response cache on (off by default so every '
+                             'request reaches the database)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--output', default=None, help='write the report as JSON')
+    parser.add_argument('--compare', default=None, help='a previous JSON report')
+    args = parser.parse_args()
+
+    actors = SCALES[args.scale]
+    movies = max(1, actors // 10)
+    selected = routes(actors, movies)
+    for name in args.routes or []:
+        if name not in selected:
+            parser.error(f'unknown route {name!r}, expected one of {list(selected)}')
+    if args.routes:
+        selected = {name: selected[name] for name in args.routes}
+
+    directory = tempfile.TemporaryDirectory()
+    database_url = args.database_url or f'sqlite:///{directory.name}/bench.db'
+
+    signer = LocalSigner()
+    signer.install()
+    token = signer.token(PERMISSIONS)
+
+    app = create_app(test_config=True)
+    setup_db(app, database_url)
+    if not args.response_cache:
+        response_cache.backend = None
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        seed(actors, movies)
+        print(f'seeded {actors} actors and {movies} movies in '
+              f'{time.perf_counter() - started:.1f}s')
+        counter = StatementCounter(db.engine)
+
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = make_server('127.0.0.1', args.port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'database': db.engine.dialect.name,
+                'scale': args.scale,
+                'actors': actors,
+                'movies': movies,
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'response_cache': args.response_cache,
+            },
+            'routes': {}
+        }
+        try:
+            for number, (name, route) in enumerate(selected.items()):
+                method, path, body, ids = route
+                if ids is None:
+                    # The first request warms per-process caches (spec,
+                    # search index, JWKS) and is not measured.
+                    rng = random.Random(args.seed)
+                    requests.request(method, base_url + path(rng),
+                                     headers={'Authorization': f'Bearer {token}'},
+                                     json=body(rng) if body else None, timeout=600)
+                statements = counter.count
+                latencies, errors, elapsed = drive(base_url, token, route, args,
+                                                   args.seed + number)
+                count = len(latencies)
+                report['routes'][name] = {
+                    'requests': count,
+                    'errors': errors,
+                    'rps': round(count / elapsed, 1),
+                    'p50_ms': round(statistics.median(latencies) * 1000, 2) if count else 0,
+                    'p95_ms': round(percentile(latencies, 95), 2) if count else 0,
+                    'p99_ms': round(percentile(latencies, 99), 2) if count else 0,
+                    'queries_per_request': round((counter.count - statements) / count, 2)
+                                           if count else 0,
+                }
+        finally:
+            server.shutdown()
+            db.session.remove()
+            db.engine.dispose()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+    print_report(report, previous)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
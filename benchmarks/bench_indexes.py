@@ -0,0 +1,137 @@
+"""
+Measure the API's lookup queries on Postgres with and without the secondary
+indexes declared in models.py.
+
+Seeds a synthetic dataset into the given database (its actors, movies and
+data_versions tables are dropped and recreated), then prints the query plan
+and mean latency of each lookup before and after the indexes are created.
+
+    python benchmarks/bench_indexes.py \\
+        --database-url postgresql://localhost:5432/agency_bench --actors 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.schema import CreateIndex
+from models import db, Actor, Movie
+
+QUERIES = {
+    'cast of 50 movies': (
+        "SELECT movie_id, name FROM actors WHERE movie_id = ANY(:ids) ORDER BY id",
+        {'ids': list(range(1, 51))}
+    ),
+    'actors keyset by name': (
+        "SELECT id, name FROM actors WHERE (name, id) > (:name, 0) "
+        "ORDER BY name, id LIMIT 50",
+        {'name': 'Actor 8'}
+    ),
+    # The ?name= and ?title= filters, as actor_filters and movie_filters send them.
+    'actor name prefix': (
+        "SELECT id, name FROM actors WHERE name ILIKE :pattern ESCAPE '\\' "
+        "ORDER BY name, id LIMIT 50",
+        {'pattern': 'Actor 4f3%'}
+    ),
+    'actor name substring': (
+        "SELECT id, name FROM actors WHERE name ILIKE :pattern LIMIT 50",
+        {'pattern': '%c0ffe%'}
+    ),
+    'movie title prefix': (
+        "SELECT id, title FROM movies WHERE title ILIKE :pattern ESCAPE '\\' "
+        "ORDER BY title, id LIMIT 50",
+        {'pattern': 'Movie 4242%'}
+    ),
+}
+
+
+def lookup_indexes():
+    return [index for table in (Actor.__table__, Movie.__table__)
+            for index in table.indexes]
+
+
+def seed(conn, actors, movies):
+    conn.execute(text(
+        "INSERT INTO movies (title, release_date) "
+        "SELECT 'Movie ' || g, DATE '1950-01-01' + (g % 25000) "
+        "FROM generate_series(1, :movies) g"
+    ), {'movies': movies})
+    conn.execute(text(
+        "INSERT INTO actors (name, age, gender, movie_id) "
+        "SELECT 'Actor ' || md5(g::text), 18 + g % 70, "
+        "(CASE WHEN g % 2 = 0 THEN 'Male' ELSE 'Female' END)::\"Gender\", "
+        "1 + g % :movies "
+        "FROM generate_series(1, :actors) g"
+    ), {'actors': actors, 'movies': movies})
+    conn.execute(text("ANALYZE actors"))
+    conn.execute(text("ANALYZE movies"))
+
+
+def run_queries(conn, repeat):
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        plan = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + sql), params).scalars().all()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(text(sql), params).all()
+            timings.append(time.perf_counter() - start)
+        results[name] = (statistics.mean(timings) * 1000, plan)
+    return results
+
+
+def report(title, results, show_plans):
+    print(f'\n== {title} ==')
+    for name, (latency, plan) in results.items():
+        print(f'{name:<24}{latency:>10.2f} ms   {plan[0].strip()}')
+        if show_plans:
+            for line in plan[1:]:
+                print(' ' * 28 + line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--actors', type=int, default=100000)
+    parser.add_argument('--movies', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--plans', action='store_true', help='print full query plans')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    with engine.begin() as conn:
+        db.metadata.drop_all(conn)
+        db.metadata.create_all(conn)
+        for index in lookup_indexes():
+            conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+        seed(conn, args.actors, args.movies)
+
+    with engine.connect() as conn:
+        before = run_queries(conn, args.repeat)
+
+    with engine.begin() as conn:
+        for index in lookup_indexes():
+            conn.execute(CreateIndex(index))
+        conn.execute(text("ANALYZE actors"))
+        conn.execute(text("ANALYZE movies"))
+
+    with engine.connect() as conn:
+        after = run_queries(conn, args.repeat)
+
+    print(f'{args.actors} actors, {args.movies} movies')
+    report('without indexes', before, args.plans)
+    report('with indexes', after, args.plans)
+    print('\n== speedup ==')
+    for name in QUERIES:
+        print(f'{name:<24}{before[name][0] / after[name][0]:>10.1f}x')
+
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
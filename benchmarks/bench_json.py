@@ -0,0 +1,79 @@
+"""
+Compare the time to encode large API responses with Flask's default JSON
+provider and with `FastJSONProvider`.
+
+Builds a `GET /actors?...`-style payload of actor dicts and a `GET /movies`
+payload of movie dicts (with `datetime.date` release dates and cast names),
+checks that both providers produce the same bytes and reports the mean time
+per response.
+
+    python benchmarks/bench_json.py --actors 100000 --movies 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from json_provider import FastJSONProvider
+
+
+def actors_payload(count):
+    return {'success': True, 'actors': [
+        {'id': i, 'name': f'Actor {i}', 'age': 18 + i % 70,
+         'gender': 'Male' if i % 2 else 'Female', 'movie_id': i // 10 + 1}
+        for i in range(count)
+    ]}
+
+
+def movies_payload(count):
+    start = date(1950, 1, 1)
+    return {'success': True, 'movies': [
+        {'title': f'Movie {i}', 'release_date': start + timedelta(days=i % 25000),
+         'actors': [f'Actor {i}-{a}' for a in range(3)]}
+        for i in range(count)
+    ]}
+
+
+def measure(app, provider, payload, repeat):
+    timings = []
+    with app.app_context():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = provider.response(payload).get_data()
+            timings.append(time.perf_counter() - start)
+    return statistics.mean(timings) * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--actors', type=int, default=100000)
+    parser.add_argument('--movies', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    providers = [('default', DefaultJSONProvider(app)), ('fast', FastJSONProvider(app))]
+    if not providers[1][1].fast:
+        print('orjson is not installed, FastJSONProvider uses the standard library')
+
+    print(f'{"payload":<16}{"provider":<10}{"ms/response":>12}{"MiB":>8}')
+    for name, payload in [(f'{args.actors} actors', actors_payload(args.actors)),
+                          (f'{args.movies} movies', movies_payload(args.movies))]:
+        bodies = []
+        for provider_name, provider in providers:
+            latency, body = measure(app, provider, payload, args.repeat)
+            bodies.append(body)
+            print(f'{name:<16}{provider_name:<10}{latency:>12.1f}'
+                  f'{len(body) / 1024 / 1024:>8.1f}')
+        if bodies[0] != bodies[1]:
+            raise SystemExit(f'{name}: the providers produced different bodies')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare the ORM read path of GET /actors and GET /movies with the
+column-only read path (for movies: the precomputed `cast_names` instead of
+walking each movie's actors).
+
+Seeds a SQLite database (or DATABASE_URL when --database-url is given) and,
+for each path, reports the mean latency per request and the peak memory
+allocated while building the JSON response.
+
+    python benchmarks/bench_read_path.py --actors 10000 --movies 1000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask, jsonify
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+from models import setup_db, db, Actor, Movie
+from app import format_movies
+
+
+def orm_actors():
+    actors = Actor.query.all()
+    return jsonify({'success': True, 'actors': [actor.name for actor in actors]})
+
+
+def lean_actors():
+    actors = db.session.execute(select(Actor.name)).scalars().all()
+    return jsonify({'success': True, 'actors': actors})
+
+
+def orm_movies():
+    movies = Movie.query.options(selectinload(Movie.actors)).all()
+    return jsonify({'success': True, 'movies': [{
+        'title': movie.title,
+        'release_date': movie.release_date,
+        'actors': [actor.name for actor in movie.actors]
+    } for movie in movies]})
+
+
+def lean_movies():
+    movies = db.session.query(Movie.id, Movie.title, Movie.release_date,
+                              Movie.cast_names).all()
+    return jsonify({'success': True, 'movies': format_movies(movies)})
+
+
+def seed(actors, movies):
+    db.session.execute(insert(Movie), [
+        {'title': f'Movie {i}', 'release_date': date(2000, 1, 1)}
+        for i in range(movies)
+    ])
+    db.session.execute(insert(Actor), [
+        {'name': f'Actor {i}', 'age': 20 + i % 60, 'gender': 'Male',
+         'movie_id': i % movies + 1}
+        for i in range(actors)
+    ])
+    db.session.commit()
+    Movie.rebuild_casts()
+
+
+def measure(app, view, repeat):
+    timings = []
+    peaks = []
+    for _ in range(repeat):
+        with app.test_request_context():
+            db.session.expunge_all()
+            tracemalloc.start()
+            start = time.perf_counter()
+            view().get_data()
+            timings.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            db.session.remove()
+    return statistics.mean(timings) * 1000, max(peaks) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--actors', type=int, default=10000)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    setup_db(app, args.database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(args.actors, args.movies)
+
+    print(f'{"path":<14}{"ms/request":>12}{"peak KiB":>12}')
+    for name, view in [('orm actors', orm_actors), ('lean actors', lean_actors),
+                       ('orm movies', orm_movies), ('lean movies', lean_movies)]:
+        latency, peak = measure(app, view, args.repeat)
+        print(f'{name:<14}{latency:>12.2f}{peak:>12.0f}')
+
+    with app.app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
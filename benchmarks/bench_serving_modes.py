@@ -0,0 +1,116 @@
+"""
+Load-test the sync (`gunicorn app:app`) and async (`gunicorn -k eventlet
+async_app:app`) serving modes with the same number of worker processes.
+
+Both modes run the same code in the same number of processes, so their
+memory budget is the same; the resident memory of each server is measured
+and printed next to the throughput and latency to confirm it.
+
+    python benchmarks/bench_serving_modes.py \\
+        --database-url postgresql://localhost:5432/agency \\
+        --token "$TOKEN" --path /movies --workers 2 --concurrency 64
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'sync': ['app:app'],
+    'async': ['-k', 'eventlet', '--worker-connections', '1000', 'async_app:app'],
+}
+
+
+def start_server(mode, args):
+    env = dict(os.environ, DATABASE_URL=args.database_url,
+               DB_POOL_SIZE=str(args.pool_size))
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers),
+               '-b', f'127.0.0.1:{args.port}', '--log-level', 'warning'] + MODES[mode]
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{args.port}/'
+    for _ in range(100):
+        try:
+            requests.get(url, timeout=5)
+            return server
+        except requests.RequestException:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+def server_rss(server):
+    process = psutil.Process(server.pid)
+    processes = [process] + process.children(recursive=True)
+    return sum(p.memory_info().rss for p in processes) / 1024 / 1024
+
+
+def run_load(args):
+    url = f'http://127.0.0.1:{args.port}{args.path}'
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    deadline = time.monotonic() + args.duration
+
+    def client():
+        session = requests.Session()
+        latencies, errors = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.get(url, headers=headers, timeout=30)
+                if response.status_code != 200:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        return latencies, errors
+
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(lambda _: client(), range(args.concurrency)))
+    latencies = sorted(l for result, _ in results for l in result)
+    errors = sum(e for _, e in results)
+    return latencies, errors
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--token', default='', help='bearer token for protected routes')
+    parser.add_argument('--path', default='/movies')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--pool-size', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    print(f'{args.path}, {args.workers} workers, {args.concurrency} concurrent clients')
+    print(f'{"mode":<8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+          f'{"errors":>8}{"RSS MiB":>10}')
+    for mode in args.modes:
+        server = start_server(mode, args)
+        try:
+            latencies, errors = run_load(args)
+            rss = server_rss(server)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f'{mode:<8}{len(latencies) / args.duration:>10.1f}'
+              f'{statistics.median(latencies) * 1000:>10.1f}'
+              f'{percentile(latencies, 95):>10.1f}{percentile(latencies, 99):>10.1f}'
+              f'{errors:>8}{rss:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
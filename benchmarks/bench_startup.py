@@ -0,0 +1,61 @@
+"""
+Measure cold start: the time from a fresh interpreter importing `app` to the
+first response of a request, split into import, first request and a second
+request to the same route.
+
+Each run uses a new Python process so module import and app creation are
+included every time.
+
+    python benchmarks/bench_startup.py --path /api/spec --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+status = client.get(sys.argv[1]).status_code
+first = time.perf_counter()
+client.get(sys.argv[1])
+second = time.perf_counter()
+print(json.dumps({'import': imported - start, 'first': first - imported,
+                  'second': second - first, 'status': status}))
+"""
+
+
+def run_once(path, env):
+    output = subprocess.run([sys.executable, '-c', CHILD, path], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--path', default='/api/spec')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL=args.database_url)
+    runs = [run_once(args.path, env) for _ in range(args.runs)]
+
+    print(f'{args.path}, {args.runs} runs, status {runs[0]["status"]}')
+    print(f'{"phase":<16}{"mean ms":>10}{"min ms":>10}')
+    for phase in ('import', 'first', 'second'):
+        values = [run[phase] * 1000 for run in runs]
+        print(f'{phase:<16}{statistics.mean(values):>10.1f}{min(values):>10.1f}')
+    total = [(run['import'] + run['first']) * 1000 for run in runs]
+    print(f'{"to first resp.":<16}{statistics.mean(total):>10.1f}{min(total):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
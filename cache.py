@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+from metrics import CACHE_REQUESTS
+from models import DataVersion
+
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+
+## Backends
+
+class MemoryBackend:
+    '''
+    In-process LRU store. Each gunicorn worker has its own copy; keys carry
+    the data versions, so a write in one worker is seen by all of them at
+    once. A shared backend only saves memory and avoids building the same
+    body again in each worker.
+    '''
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedBackend:
+    '''
+    Store shared by every worker, backed by a Redis-compatible client (any
+    object with `get` and `set(key, value, ex=ttl)`).
+    '''
+
+    def __init__(self, client, prefix='casting-agency'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(f'{self.prefix}:{key}')
+
+    def set(self, key, value, ttl=None):
+        self.client.set(f'{self.prefix}:{key}', value, ex=ttl)
+
+
+def backend_from_env(environ=os.environ):
+    '''
+    RESPONSE_CACHE_URL selects a shared Redis backend (needs the `redis`
+    package), RESPONSE_CACHE=off disables caching, otherwise the in-process
+    LRU backend is used.
+    '''
+    if environ.get('RESPONSE_CACHE', '').lower() == 'off':
+        return None
+    url = environ.get('RESPONSE_CACHE_URL')
+    if url:
+        import redis
+        return SharedBackend(redis.Redis.from_url(url))
+    return MemoryBackend()
+
+
+## Response Cache
+
+class ResponseCache:
+    '''
+    Caches successful GET response bodies keyed by route and query string.
+
+    Every entry is tagged with the tables it was built from, and the key
+    holds their `DataVersion` versions. Every write bumps the version of
+    its table in the database, so a write made by any worker or job process
+    stops exactly the entries built from that table from being served.
+    '''
+
+    def __init__(self, backend=None, ttl=RESPONSE_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, tags):
+        # `conditional` leaves the versions it read in g.data_versions.
+        versions = g.get('data_versions', {})
+        missing = [tag for tag in tags if tag not in versions]
+        if missing:
+            versions = {**versions, **DataVersion.current(*missing)}
+        generations = ','.join(f'{tag}.{versions[tag][0]}' for tag in tags)
+        query = '&'.join(sorted(f'{name}={value}'
+                                for name, value in request.args.items(multi=True)))
+        return f'response:{request.path}?{query}#{generations}'
+
+    def variant(self, name, body, build):
+        '''
+        Return `build()`, a derived form of the response `body` (such as
+        its compressed bytes), cached next to the request's cached body so
+        it is only built once per entry. Bodies that did not come from the
+        cache are built every time.
+        '''
+        entry = g.get('response_cache_entry')
+        if self.backend is None or entry is None or entry[1] != body:
+            return build()
+        key = f'{entry[0]}|{name}'
+        value = self.backend.get(key)
+        if value is not None:
+            CACHE_REQUESTS.labels('response:' + name, 'hit').inc()
+            return value
+        CACHE_REQUESTS.labels('response:' + name, 'miss').inc()
+        value = build()
+        self.backend.set(key, value, self.ttl)
+        return value
+
+    def cached(self, *tags):
+        '''
+        Serve the view's body from the cache. Use it below `requires_auth`
+        so permissions are checked before a cached body is returned.
+        '''
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return f(*args, **kwargs)
+
+                key = self.key(tags)
+                body = self.backend.get(key)
+                if body is not None:
+                    g.response_cache_entry = (key, body)
+                    self.hits += 1
+                    CACHE_REQUESTS.labels('response', 'hit').inc()
+                    response = make_response(body)
+                    response.mimetype = 'application/json'
+                    return response
+
+                self.misses += 1
+                CACHE_REQUESTS.labels('response', 'miss').inc()
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    body = response.get_data()
+                    self.backend.set(key, body, self.ttl)
+                    g.response_cache_entry = (key, body)
+                return response
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache(backend_from_env())
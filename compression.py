@@ -0,0 +1,116 @@
+import gzip
+import os
+import zlib
+from flask import request
+from cache import response_cache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+COMPRESS_MIMETYPES = {'application/json', 'application/x-ndjson', 'application/javascript',
+                      'text/html', 'text/css', 'text/plain'}
+
+
+## Negotiation
+
+def supported_encodings():
+    '''Encodings the server can produce, in order of preference.'''
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate():
+    '''
+    Best encoding for the current request's Accept-Encoding header, or None
+    when the client only accepts the identity encoding.
+    '''
+    return request.accept_encodings.best_match(supported_encodings())
+
+
+## Compressors
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    '''
+    Compress an iterable of byte chunks as it is consumed. Output is yielded
+    whenever the compressor emits a block, so a streamed export is never
+    held in memory.
+    '''
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        block = process(chunk)
+        if block:
+            yield block
+    yield finish()
+
+
+## Flask Hooks
+
+def compressible(response):
+    return (response.mimetype in COMPRESS_MIMETYPES
+            and 200 <= response.status_code < 300
+            and response.status_code not in (204, 206)
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers)
+
+
+def weaken_etag(response):
+    # The compressed body is a different byte sequence, so its validator can
+    # only be weak; `conditional` compares If-None-Match weakly.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def install_compression(app):
+    '''
+    Compress the responses of `app` with brotli or gzip, as negotiated from
+    Accept-Encoding. Bodies smaller than COMPRESS_MIN_SIZE are sent as is,
+    streamed bodies are compressed chunk by chunk, and the compressed copy
+    of a body served from the response cache is cached next to it.
+    '''
+    if not COMPRESSION_ENABLED:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304:
+            if negotiate() is not None:
+                response.vary.add('Accept-Encoding')
+                weaken_etag(response)
+            return response
+        if not compressible(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < COMPRESS_MIN_SIZE:
+                return response
+            response.set_data(response_cache.variant(
+                encoding, data, lambda: compress(data, encoding)))
+        response.headers['Content-Encoding'] = encoding
+        weaken_etag(response)
+        return response
@@ -0,0 +1,108 @@
+"""
+Gunicorn settings for production.
+
+Every setting can be overridden from the environment:
+
+    GUNICORN_WORKER_CLASS     sync (default), gthread or eventlet
+    WEB_CONCURRENCY           worker processes (default depends on the class)
+    GUNICORN_THREADS          threads per gthread worker (default 4)
+    GUNICORN_CONNECTIONS      concurrent requests per eventlet worker
+    GUNICORN_PRELOAD          load the app once in the master before forking
+    GUNICORN_MAX_REQUESTS     recycle a worker after this many requests
+    GUNICORN_TIMEOUT          seconds before a silent worker is restarted
+    GUNICORN_KEEPALIVE        seconds to keep idle client connections open
+    PORT                      port to listen on (default 5000)
+    PROMETHEUS_MULTIPROC_DIR  directory where the workers share their metrics
+
+The eventlet class serves `async_app:app`, which makes the standard library
+and psycopg2 cooperative before the app is imported. gevent is not offered:
+async_app installs eventlet's hub, which cannot run inside a gevent worker.
+"""
+import glob
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+if worker_class not in ("sync", "gthread", "eventlet"):
+    raise RuntimeError(f"unsupported GUNICORN_WORKER_CLASS {worker_class!r}, "
+                       "use sync, gthread or eventlet")
+green = worker_class == "eventlet"
+
+wsgi_app = "async_app:app" if green else "app:app"
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+if green:
+    default_workers = cpu_count
+elif worker_class == "gthread":
+    default_workers = cpu_count + 1
+else:
+    default_workers = 2 * cpu_count + 1
+workers = int(os.environ.get("WEB_CONCURRENCY", default_workers))
+threads = int(os.environ.get("GUNICORN_THREADS", 4 if worker_class == "gthread" else 1))
+worker_connections = int(os.environ.get("GUNICORN_CONNECTIONS", 500))
+
+# async_app patches the standard library at import time, so preloading is safe
+# for every worker class as long as the eventlet class loads async_app.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() != "false"
+
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = max(1, max_requests // 10) if max_requests else 0
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = timeout
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def _dispose_engine(server, close):
+    from models import db
+    app = server.app.wsgi()
+    with app.app_context():
+        db.engine.dispose(close=close)
+
+
+def on_starting(server):
+    # Metrics files left by a previous run would be summed into this one.
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+
+def when_ready(server):
+    # With preload_app the master connected while creating the app; close
+    # those connections so they are not inherited by the workers.
+    if preload_app:
+        _dispose_engine(server, close=True)
+
+
+def post_fork(server, worker):
+    # Drop any pooled connections copied from the master without closing
+    # them, so no database connection is shared across processes.
+    if preload_app:
+        _dispose_engine(server, close=False)
+
+
+def child_exit(server, worker):
+    # Drop the live gauges (in-flight requests, pool connections) of a worker
+    # that exited; its counters and histograms keep counting in the total.
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Recover the background jobs of workers that exited (see jobs.recover).
+    from jobs import start_recovery
+    start_recovery(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    # Give jobs running on this worker's threads (memory:// broker) the
+    # graceful timeout to finish; the others are picked up by recovery.
+    from jobs import runner
+    runner.wait(graceful_timeout)
@@ -0,0 +1,120 @@
+'''
+Shared setup for the offline test suite.
+
+Tests run against a database private to the test process and verify tokens
+minted by a local RSA key, so they need neither Auth0 nor a shared database
+and can run in parallel with pytest-xdist (`pytest -n auto`).
+
+    TEST_DATABASE_URL   sqlite:// (default) or a Postgres URL; with Postgres
+                        every xdist worker gets its own database, named
+                        after the URL's database plus the worker id
+'''
+import os
+import unittest
+from contextlib import contextmanager
+from functools import lru_cache
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+import auth
+from auth import VerifiedTokenCache
+from cache import response_cache, MemoryBackend
+from local_auth import LocalSigner
+from models import setup_db, db
+from search import search_index
+from app import create_app
+
+ROLES = {
+    'assistant': ['get:actors', 'get:movies'],
+    'director': ['get:actors', 'get:movies', 'post:actors', 'patch:actors',
+                 'patch:movies', 'delete:actors'],
+    'producer': ['get:actors', 'get:movies', 'post:actors', 'post:movies',
+                 'patch:actors', 'patch:movies', 'delete:actors', 'delete:movies'],
+}
+
+signer = LocalSigner('test-key')
+
+
+def worker_id():
+    '''The pytest-xdist worker running this process (gw0, gw1, ...) or main.'''
+    return os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+
+@lru_cache(maxsize=None)
+def worker_database_url():
+    '''
+    Database URL for this test process. In-memory SQLite is already private
+    to the process; for Postgres a database per worker is created on first
+    use.
+    '''
+    url = make_url(os.environ.get('TEST_DATABASE_URL', 'sqlite://'))
+    if url.get_backend_name() != 'postgresql':
+        return url.render_as_string(hide_password=False)
+
+    name = f'{url.database}_{worker_id()}'
+    engine = create_engine(url, isolation_level='AUTOCOMMIT')
+    with engine.connect() as conn:
+        exists = conn.execute(text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                              {'name': name}).scalar()
+        if not exists:
+            conn.execute(text(f'CREATE DATABASE "{name}"'))
+    engine.dispose()
+    return url.set(database=name).render_as_string(hide_password=False)
+
+
+class AppTestCase(unittest.TestCase):
+    '''
+    Runs the API against the process's test database, with tokens from the
+    local signer. Tables are created before every test and dropped after
+    it, so tests neither share rows nor depend on their order.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.signer = signer
+        cls.original_store = auth.jwks_store
+        cls.original_cache = auth.token_cache
+        auth.token_cache = VerifiedTokenCache()
+        signer.install()
+
+        cls.app = create_app(test_config=True)
+        setup_db(cls.app, worker_database_url())
+        cls.client = cls.app.test_client()
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        cls.app_context.pop()
+        auth.jwks_store = cls.original_store
+        auth.token_cache = cls.original_cache
+
+    def setUp(self):
+        db.create_all()
+        response_cache.backend = MemoryBackend()
+        search_index.reset()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def auth_headers(self, role):
+        return {'Authorization': f'Bearer {self.signer.token(ROLES[role])}'}
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
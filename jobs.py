@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+import click
+from celery import Celery
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from metrics import JOB_SECONDS
+from models import db, Job
+
+JOBS_BROKER_URL = os.environ.get('JOBS_BROKER_URL', 'memory://')
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+JOBS_STALE_AFTER = int(os.environ.get('JOBS_STALE_AFTER', 300))
+JOBS_TIMEOUT = int(os.environ.get('JOBS_TIMEOUT', 3600))
+JOBS_RECOVER_INTERVAL = int(os.environ.get('JOBS_RECOVER_INTERVAL', 60))
+
+celery_app = Celery('casting_agency', broker=JOBS_BROKER_URL)
+celery_app.conf.update(
+    task_serializer='json',
+    accept_content=['json'],
+    task_ignore_result=True,
+    worker_prefetch_multiplier=1,
+)
+
+# job kind -> (permission needed to queue and poll it, function(payload))
+HANDLERS = {}
+
+
+class IdempotencyConflict(Exception):
+    '''An Idempotency-Key was reused for a different request.'''
+
+
+def handler(kind, permission):
+    '''Register `f(payload)` as the function run for jobs of `kind`.'''
+    def decorator(f):
+        HANDLERS[kind] = (permission, f)
+        return f
+    return decorator
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+## Queueing
+
+def fingerprint(kind, payload):
+    body = json.dumps([kind, payload], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def existing_job(subject, idempotency_key, digest):
+    job = db.session.execute(
+        select(Job).where(Job.subject == subject, Job.idempotency_key == idempotency_key)
+    ).scalar_one_or_none()
+    if job is not None and job.fingerprint != digest:
+        raise IdempotencyConflict(idempotency_key)
+    return job
+
+
+def enqueue(kind, payload, subject=None, idempotency_key=None):
+    '''
+    Store a queued job and hand it to the runner. Returns (job, created).
+
+    When `subject` already used `idempotency_key`, the job created then is
+    returned and nothing is queued; IdempotencyConflict is raised if that
+    job was for a different kind or payload.
+    '''
+    digest = fingerprint(kind, payload)
+    if idempotency_key is not None:
+        job = existing_job(subject, idempotency_key, digest)
+        if job is not None:
+            return job, False
+
+    job = Job(id=uuid.uuid4().hex, kind=kind, status='queued', subject=subject,
+              idempotency_key=idempotency_key, fingerprint=digest, payload=payload,
+              created_at=utcnow())
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key inserted its job first.
+        db.session.rollback()
+        return existing_job(subject, idempotency_key, digest), False
+    runner.submit(current_app._get_current_object(), job.id)
+    return job, True
+
+
+## Running
+
+def run(job_id):
+    '''
+    Run a queued job in the current app context and record its result or
+    error. The job is claimed with a conditional UPDATE, so a job that is
+    delivered twice only runs once.
+    '''
+    claimed = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='running', started_at=utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return
+
+    kind, payload = db.session.execute(
+        select(Job.kind, Job.payload).where(Job.id == job_id)).one()
+    start = time.perf_counter()
+    try:
+        values = {'status': 'succeeded', 'result': HANDLERS[kind][1](payload)}
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('job %s (%s) failed', job_id, kind)
+        values = {'status': 'failed', 'error': e.__class__.__name__}
+    # A job that `recover` gave up on stays failed.
+    db.session.execute(update(Job).where(Job.id == job_id, Job.status == 'running')
+                       .values(finished_at=utcnow(), **values))
+    db.session.commit()
+    JOB_SECONDS.labels(kind, values['status']).observe(time.perf_counter() - start)
+
+
+def recover(now=None):
+    '''
+    Pick up the jobs of processes that went away, e.g. a web worker that
+    was recycled. With the LocalRunner, jobs still queued after
+    JOBS_STALE_AFTER seconds are handed to the runner again; `run` claims a
+    job once, so a job that was only waiting is not run twice. A Celery
+    broker keeps its queued tasks when a web worker exits, so they are left
+    to it rather than sent again on every call. Jobs running for more than
+    JOBS_TIMEOUT seconds are marked failed, since a half-run import cannot
+    safely be repeated. Returns (requeued, failed).
+    '''
+    now = now or utcnow()
+    failed = db.session.execute(
+        update(Job).where(Job.status == 'running',
+                          Job.started_at < now - timedelta(seconds=JOBS_TIMEOUT))
+        .values(status='failed', error='WorkerLost', finished_at=now)
+    ).rowcount
+    db.session.commit()
+    if not isinstance(runner, LocalRunner):
+        return 0, failed
+    ids = db.session.execute(
+        select(Job.id).where(Job.status == 'queued',
+                             Job.created_at < now - timedelta(seconds=JOBS_STALE_AFTER))
+    ).scalars().all()
+    app = current_app._get_current_object()
+    for job_id in ids:
+        runner.submit(app, job_id)
+    return len(ids), failed
+
+
+def start_recovery(app, interval=JOBS_RECOVER_INTERVAL):
+    '''
+    Call `recover` every `interval` seconds on a daemon thread. gunicorn
+    starts it in every web worker after forking.
+    '''
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    recover()
+            except Exception:
+                app.logger.exception('job recovery failed')
+
+    thread = threading.Thread(target=loop, name='job-recovery', daemon=True)
+    thread.start()
+    return thread
+
+
+@celery_app.task(name='jobs.run')
+def run_job(job_id):
+    with celery_app.flask_app.app_context():
+        run(job_id)
+
+
+## Runners
+
+class LocalRunner:
+    '''
+    Runs jobs on a thread pool inside the web process, for the memory://
+    broker: no RabbitMQ and no worker process are needed. Jobs left behind
+    by a process that exits are picked up by `recover` in another one.
+    With `workers=0` a job runs in the request that queued it, before the
+    202 response is sent.
+    '''
+
+    def __init__(self, workers=JOBS_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, app, job_id):
+        if not self.workers:
+            run(job_id)
+            return
+        with self._lock:
+            if job_id in self.pending:
+                return
+            if self.executor is None:
+                self.executor = futures.ThreadPoolExecutor(self.workers, thread_name_prefix='job')
+            future = self.executor.submit(self._run, app, job_id)
+            self.pending[job_id] = future
+        future.add_done_callback(lambda _: self.pending.pop(job_id, None))
+
+    @staticmethod
+    def _run(app, job_id):
+        with app.app_context():
+            run(job_id)
+
+    def wait(self, timeout=None):
+        '''Block until the jobs submitted so far have finished.'''
+        futures.wait(list(self.pending.values()), timeout)
+
+
+class CeleryRunner:
+    '''Sends jobs to the Celery workers listening on JOBS_BROKER_URL.'''
+
+    def submit(self, app, job_id):
+        run_job.delay(job_id)
+
+    def wait(self, timeout=None):
+        '''The jobs run in the workers, so there is nothing to wait for.'''
+
+
+def runner_from_env(environ=os.environ):
+    '''
+    The memory:// broker (the default) runs jobs in process with JOBS_WORKERS
+    threads; any other JOBS_BROKER_URL (e.g. amqp://) sends them to Celery.
+    '''
+    if environ.get('JOBS_BROKER_URL', 'memory://').startswith('memory://'):
+        return LocalRunner(int(environ.get('JOBS_WORKERS', JOBS_WORKERS)))
+    return CeleryRunner()
+
+
+def init_jobs(app):
+    '''Run the Celery tasks of a worker process in `app`'s context.'''
+    celery_app.flask_app = app
+    app.extensions['celery'] = celery_app
+
+    @app.cli.command('recover-jobs')
+    def recover_jobs():
+        '''Requeue stale queued jobs (memory:// broker) and fail jobs that ran past JOBS_TIMEOUT.'''
+        requeued, failed = recover()
+        runner.wait()
+        click.echo(f'requeued {requeued} jobs, marked {failed} jobs as failed')
+
+
+runner = runner_from_env()
@@ -0,0 +1,88 @@
+import os
+import re
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# "stdlib" forces the standard library encoder even when orjson is installed.
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'auto').lower()
+
+# Characters json.dumps(ensure_ascii=True) escapes but orjson writes as is.
+NON_ASCII_RE = re.compile('[\x7f-\U0010ffff]')
+
+
+def escape_non_ascii(text):
+    '''Escape DEL and non-ASCII characters the way `json.dumps` does.'''
+    def escape(match):
+        code = ord(match.group())
+        if code > 0xffff:
+            code -= 0x10000
+            return '\\u{:04x}\\u{:04x}'.format(0xd800 | (code >> 10), 0xdc00 | (code & 0x3ff))
+        return '\\u{:04x}'.format(code)
+    return NON_ASCII_RE.sub(escape, text)
+
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def date_header(value):
+    '''
+    HTTP date string of a `date` at midnight GMT, as `werkzeug.http.http_date`
+    writes it, without going through a datetime and `email.utils`.
+    '''
+    return (f'{WEEKDAYS[value.weekday()]}, {value.day:02d} {MONTHS[value.month - 1]} '
+            f'{value.year:04d} 00:00:00 GMT')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    '''
+    Flask JSON provider that encodes response bodies with orjson when it is
+    installed and with the standard library otherwise.
+
+    The output matches `DefaultJSONProvider` byte for byte: keys are sorted,
+    separators are compact, dates go through Flask's `default` (HTTP date
+    strings) and non-ASCII characters are escaped as `\\uXXXX`. Values
+    orjson cannot encode (such as integers above 64 bits) and pretty
+    printed debug output fall back to the standard library. orjson writes
+    floats below 1e-4 or from 1e16 without an exponent and NaN as null; the
+    API's own payloads never contain such floats.
+    '''
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.fast = orjson is not None and JSON_PROVIDER != 'stdlib'
+
+    @staticmethod
+    def default(o):
+        if type(o) is date:
+            return date_header(o)
+        return DefaultJSONProvider.default(o)
+
+    def fast_dumps(self, obj):
+        '''Return the compact encoding of `obj` as bytes, or None.'''
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            body = orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            return None
+        # DEL is ASCII but the stdlib encoder escapes it as well.
+        if self.ensure_ascii and (not body.isascii() or b'\x7f' in body):
+            body = escape_non_ascii(body.decode()).encode()
+        return body
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if not self.fast or pretty:
+            return super().response(*args, **kwargs)
+        body = self.fast_dumps(self._prepare_response_obj(args, kwargs))
+        if body is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+import auth
+from auth import JWKSKeyStore
+
+
+## Local Signer
+
+class LocalSigner:
+    '''
+    RSA key pair that stands in for the Auth0 tenant in benchmarks and
+    tests: it publishes a JWKS and mints RS256 access tokens with the issuer
+    and audience `auth.verify_decode_jwt` expects.
+    '''
+
+    def __init__(self, kid='local-key', private_pem=None):
+        self.kid = kid
+        if private_pem is None:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            private_pem = private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            ).decode()
+        else:
+            private_key = serialization.load_pem_private_key(private_pem.encode(), None)
+        self.private_pem = private_pem
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self.public_jwk = jwk.construct(public_pem, 'RS256').to_dict()
+        self.public_jwk.update({'kid': kid, 'use': 'sig'})
+
+    def jwks(self):
+        return {'keys': [self.public_jwk]}
+
+    def token(self, permissions, expires_in=3600, subject='local|user'):
+        now = int(time.time())
+        claims = {
+            'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+            'aud': auth.API_AUDIENCE,
+            'sub': subject,
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions)
+        }
+        return jwt.encode(claims, self.private_pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+    def write_jwks(self, path):
+        '''Write the JWKS to `path` and return its file:// URL for JWKS_URL.'''
+        with open(path, 'w') as jwks_file:
+            json.dump(self.jwks(), jwks_file)
+        return Path(path).resolve().as_uri()
+
+    def install(self):
+        '''Make `auth` verify tokens against this signer's JWKS.'''
+        auth.jwks_store = JWKSKeyStore(self.jwks, background=False)
+        auth.token_cache.clear()
+
+
+## Command Line
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Mint an access token signed by a local key and write its JWKS.')
+    parser.add_argument('permissions', nargs='*', help='e.g. get:actors get:movies')
+    parser.add_argument('--key', default='local_key.pem',
+                        help='private key, created when missing')
+    parser.add_argument('--jwks', default='local_jwks.json')
+    parser.add_argument('--expires-in', type=int, default=86400)
+    args = parser.parse_args()
+
+    if os.path.exists(args.key):
+        with open(args.key) as key_file:
+            signer = LocalSigner(private_pem=key_file.read())
+    else:
+        signer = LocalSigner()
+        with open(args.key, 'w') as key_file:
+            key_file.write(signer.private_pem)
+    url = signer.write_jwks(args.jwks)
+    print(f'export JWKS_URL={url}')
+    print(signer.token(args.permissions, expires_in=args.expires_in))
+
+
+if __name__ == '__main__':
+    main()
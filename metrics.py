@@ -0,0 +1,193 @@
+import os
+import time
+from flask import g, has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+## HTTP Metrics
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'Time from the start of a request until its response is ready.',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS = Counter(
+    'http_requests_total',
+    'Responses sent, by route and status code.',
+    ['method', 'route', 'status']
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    'http_response_size_bytes',
+    'Size of the response bodies (streamed responses are not included).',
+    ['method', 'route'],
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000)
+)
+HTTP_IN_FLIGHT = Gauge(
+    'http_requests_in_flight',
+    'Requests currently being served.',
+    multiprocess_mode='livesum'
+)
+
+
+## SQL Metrics
+
+DB_STATEMENT_SECONDS = Histogram(
+    'db_statement_duration_seconds',
+    'Time spent executing a single SQL statement.',
+    buckets=LATENCY_BUCKETS
+)
+DB_REQUEST_STATEMENTS = Histogram(
+    'db_statements_per_request',
+    'SQL statements executed while serving a request.',
+    ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+)
+DB_REQUEST_SECONDS = Histogram(
+    'db_request_duration_seconds',
+    'Total SQL execution time of a request.',
+    ['route'],
+    buckets=LATENCY_BUCKETS
+)
+
+
+## Auth And Cache Metrics
+
+JWT_VERIFY_SECONDS = Histogram(
+    'jwt_verify_duration_seconds',
+    'Time spent verifying a bearer token that was not in the token cache.',
+    buckets=LATENCY_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by cache (token, response, response:<encoding>) and result (hit, miss).',
+    ['cache', 'result']
+)
+
+
+## Job Metrics
+
+JOB_SECONDS = Histogram(
+    'job_duration_seconds',
+    'Run time of background jobs, by kind and final status.',
+    ['kind', 'status'],
+    buckets=(.01, .05, .1, .5, 1, 5, 10, 30, 60, 300, 900)
+)
+
+
+## Database Pool Metrics
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    'db_pool_checkout_seconds',
+    'Time spent waiting for a connection from the pool.',
+    buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+)
+DB_POOL_EXHAUSTED = Counter(
+    'db_pool_exhausted_total',
+    'Checkouts that timed out because every pooled connection was in use.'
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out_connections',
+    'Connections currently checked out of the pool.',
+    multiprocess_mode='livesum'
+)
+
+
+class InstrumentedQueuePool(QueuePool):
+    '''
+    QueuePool that records how long each checkout waited for a connection,
+    counts the checkouts that hit `pool_timeout` and tracks the number of
+    connections in use.
+    '''
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_EXHAUSTED.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+        DB_POOL_CHECKED_OUT.inc()
+        return record
+
+    def _do_return_conn(self, record):
+        DB_POOL_CHECKED_OUT.dec()
+        super()._do_return_conn(record)
+
+
+## Statement Events
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+    DB_STATEMENT_SECONDS.observe(elapsed)
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements += 1
+        g.sql_seconds += elapsed
+
+
+## Flask Integration
+
+def route_label():
+    # The URL rule rather than the path keeps the label set bounded.
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def instrument_app(app):
+    '''
+    Record latency, status, response size, in-flight requests and SQL
+    statements for every request served by `app`.
+    '''
+    @app.before_request
+    def start_request_metrics():
+        HTTP_IN_FLIGHT.inc()
+        g.metrics_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_start' not in g:
+            return response
+        route = route_label()
+        HTTP_REQUEST_SECONDS.labels(request.method, route).observe(
+            time.perf_counter() - g.metrics_start)
+        HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+        if not response.is_streamed and response.content_length is not None:
+            HTTP_RESPONSE_BYTES.labels(request.method, route).observe(response.content_length)
+        DB_REQUEST_STATEMENTS.labels(route).observe(g.sql_statements)
+        DB_REQUEST_SECONDS.labels(route).observe(g.sql_seconds)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('metrics_start', None) is not None:
+            HTTP_IN_FLIGHT.dec()
+
+
+def render():
+    '''
+    Return the exposition body and its content type. When
+    PROMETHEUS_MULTIPROC_DIR is set the samples of every gunicorn worker
+    are aggregated from that directory.
+    '''
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,55 @@
+"""create the actors and movies tables
+
+Revision ID: 1c0b5a7e9d32
+Revises:
+Create Date: 2024-02-21 12:30:04.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '1c0b5a7e9d32'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+GENDERS = ('Male', 'Female')
+
+
+def upgrade():
+    # Databases restored from agency.sql already have these tables but no
+    # alembic version, so only a fresh database gets them created here.
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    gender = sa.Enum(*GENDERS, name='Gender')
+    if bind.dialect.name == 'postgresql':
+        gender.create(bind, checkfirst=True)
+        gender = postgresql.ENUM(*GENDERS, name='Gender', create_type=False)
+
+    if not inspector.has_table('movies'):
+        op.create_table('movies',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(), nullable=True),
+            sa.Column('release_date', sa.Date(), nullable=True),
+            sa.PrimaryKeyConstraint('id', name='movies_pkey')
+        )
+    if not inspector.has_table('actors'):
+        op.create_table('actors',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=True),
+            sa.Column('age', sa.Integer(), nullable=True),
+            sa.Column('gender', gender, nullable=True),
+            sa.Column('movie_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], name='actors_movie_id_fkey'),
+            sa.PrimaryKeyConstraint('id', name='actors_pkey')
+        )
+
+
+def downgrade():
+    op.drop_table('actors')
+    op.drop_table('movies')
+    if op.get_bind().dialect.name == 'postgresql':
+        sa.Enum(*GENDERS, name='Gender').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,29 @@
+"""add data_versions table for conditional GETs
+
+Revision ID: 3f2a9c1d7b44
+Revises: 65614b2511b3
+Create Date: 2026-10-18 10:12:41.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b44'
+down_revision = '65614b2511b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_versions',
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('data_versions')
@@ -0,0 +1,39 @@
+"""add jobs table for background jobs
+
+Revision ID: 5b7e3d90c1f4
+Revises: a9d4c2e71b58
+Create Date: 2026-10-18 17:21:09.538204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e3d90c1f4'
+down_revision = 'a9d4c2e71b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('kind', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=True),
+        sa.Column('idempotency_key', sa.String(length=255), nullable=True),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('subject', 'idempotency_key', name='uq_jobs_subject_idempotency_key')
+    )
+
+
+def downgrade():
+    op.drop_table('jobs')
@@ -1,7 +1,7 @@
 """empty message
 
 Revision ID: 65614b2511b3
-Revises: 
+Revises: 1c0b5a7e9d32
 Create Date: 2024-02-21 12:38:27.869659
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '65614b2511b3'
-down_revision = None
+down_revision = '1c0b5a7e9d32'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,43 @@
+"""add indexes for cast lookups, keyset ordering and name/title search
+
+Revision ID: 8d41e6b0c2a9
+Revises: 3f2a9c1d7b44
+Create Date: 2026-10-18 11:02:17.558930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6b0c2a9'
+down_revision = '3f2a9c1d7b44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+
+    op.create_index('ix_actors_movie_id_id', 'actors', ['movie_id', 'id'])
+    op.create_index('ix_actors_name_id', 'actors', ['name', 'id'])
+    op.create_index('ix_movies_title_id', 'movies', ['title', 'id'])
+
+    if is_postgres:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_actors_name_trgm', 'actors', ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_movies_title_trgm', 'movies', ['title'],
+                        postgresql_using='gin',
+                        postgresql_ops={'title': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_movies_title_trgm', table_name='movies')
+        op.drop_index('ix_actors_name_trgm', table_name='actors')
+
+    op.drop_index('ix_movies_title_id', table_name='movies')
+    op.drop_index('ix_actors_name_id', table_name='actors')
+    op.drop_index('ix_actors_movie_id_id', table_name='actors')
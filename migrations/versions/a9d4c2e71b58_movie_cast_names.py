@@ -0,0 +1,46 @@
+"""add the cast_names read model to movies
+
+Revision ID: a9d4c2e71b58
+Revises: e52b8f07a6c1
+Create Date: 2026-10-18 15:02:44.193520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4c2e71b58'
+down_revision = 'e52b8f07a6c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('movies', sa.Column('cast_names', sa.JSON(), nullable=False,
+                                      server_default=sa.text("'[]'")))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("""
+            UPDATE movies SET cast_names = casts.names
+            FROM (SELECT movie_id, json_agg(name ORDER BY id) AS names
+                  FROM actors WHERE movie_id IS NOT NULL GROUP BY movie_id) AS casts
+            WHERE movies.id = casts.movie_id
+        """)
+    else:
+        # Fill the existing casts row by row; run `flask check-casts
+        # --rebuild` to do the same later.
+        bind = op.get_bind()
+        actors = sa.table('actors', sa.column('id'), sa.column('name'), sa.column('movie_id'))
+        movies = sa.table('movies', sa.column('id'), sa.column('cast_names', sa.JSON()))
+        casts = {}
+        rows = bind.execute(sa.select(actors.c.movie_id, actors.c.name)
+                            .where(actors.c.movie_id.is_not(None)).order_by(actors.c.id))
+        for movie_id, name in rows:
+            casts.setdefault(movie_id, []).append(name)
+        for movie_id, names in casts.items():
+            bind.execute(movies.update().where(movies.c.id == movie_id)
+                         .values(cast_names=names))
+
+
+def downgrade():
+    op.drop_column('movies', 'cast_names')
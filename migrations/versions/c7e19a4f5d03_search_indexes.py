@@ -0,0 +1,26 @@
+"""add indexes for age and release date filters and sorting
+
+Revision ID: c7e19a4f5d03
+Revises: 8d41e6b0c2a9
+Create Date: 2026-10-18 11:47:53.120481
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e19a4f5d03'
+down_revision = '8d41e6b0c2a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_actors_age_id', 'actors', ['age', 'id'])
+    op.create_index('ix_movies_release_date_id', 'movies', ['release_date', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_movies_release_date_id', table_name='movies')
+    op.drop_index('ix_actors_age_id', table_name='actors')
@@ -0,0 +1,34 @@
+"""set null on actors.movie_id when a movie is deleted
+
+Revision ID: d3a81f6c2e97
+Revises: 5b7e3d90c1f4
+Create Date: 2026-10-18 18:04:52.671930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a81f6c2e97'
+down_revision = '5b7e3d90c1f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite does not enforce foreign keys unless asked to, so the ON DELETE
+    # rule only matters on Postgres.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_constraint('actors_movie_id_fkey', 'actors', type_='foreignkey')
+    op.create_foreign_key('actors_movie_id_fkey', 'actors', 'movies',
+                          ['movie_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_constraint('actors_movie_id_fkey', 'actors', type_='foreignkey')
+    op.create_foreign_key('actors_movie_id_fkey', 'actors', 'movies',
+                          ['movie_id'], ['id'])
@@ -0,0 +1,34 @@
+"""add full-text search indexes on actor names and movie titles
+
+Revision ID: e52b8f07a6c1
+Revises: c7e19a4f5d03
+Create Date: 2026-10-18 12:31:06.774215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e52b8f07a6c1'
+down_revision = 'c7e19a4f5d03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.create_index('ix_actors_name_fts', 'actors',
+                    [sa.text("to_tsvector('simple', coalesce(name, ''))")],
+                    postgresql_using='gin')
+    op.create_index('ix_movies_title_fts', 'movies',
+                    [sa.text("to_tsvector('simple', coalesce(title, ''))")],
+                    postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_movies_title_fts', table_name='movies')
+    op.drop_index('ix_actors_name_fts', table_name='actors')
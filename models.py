@@ -1,42 +1,289 @@
 import enum
 import os
-from sqlalchemy import Column, String, Integer, DATE, Enum
+from datetime import datetime, timezone
+import click
+from sqlalchemy import Column, String, Integer, DATE, DateTime, Enum, DDL, Index, JSON, Text, UniqueConstraint, event, select, text, update
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import relationship
 from flask_migrate import Migrate
+from metrics import InstrumentedQueuePool
 
 db = SQLAlchemy()
 
+# INSERT ... ON CONFLICT constructs of the supported databases.
+UPSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+CAST_REBUILD_BATCH_SIZE = int(os.environ.get('CAST_REBUILD_BATCH_SIZE', 1000))
+
+# The trigram indexes on actor names and movie titles need pg_trgm.
+event.listen(
+    db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
+def trigram_index(name, column):
+    '''GIN trigram index for prefix and substring LIKE/ILIKE on Postgres.'''
+    return Index(name, column, postgresql_using='gin',
+                 postgresql_ops={column: 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+
+
+def fulltext_index(name, column):
+    '''GIN index on the `simple` tsvector of `column`, used by /search.'''
+    return Index(name, text(f"to_tsvector('simple', coalesce({column}, ''))"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql')
+
+
+def engine_options(database_path, environ=os.environ):
+    '''
+    Build the SQLAlchemy engine options for `database_path` from the
+    environment. Pool settings only apply to server databases (Postgres);
+    SQLite keeps the pool Flask-SQLAlchemy picks for it.
+
+    DB_POOL_SIZE          connections kept open per process (default 5)
+    DB_MAX_OVERFLOW       extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT       seconds to wait for a free connection (default 10)
+    DB_POOL_RECYCLE       seconds before a connection is replaced (default 1800)
+    DB_POOL_PRE_PING      test connections before use, "false" to disable
+    DB_STATEMENT_TIMEOUT  per-statement timeout in milliseconds (default 30000)
+    '''
+    if database_path.startswith('sqlite'):
+        return {}
+
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() != 'false',
+    }
+    statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT', 30000))
+    if statement_timeout > 0 and database_path.startswith('postgres'):
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={statement_timeout}'
+        }
+    return options
+
 
 def setup_db(app, database_path=os.environ['DATABASE_URL']):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     migrate = Migrate(app, db)
-    with app.app_context():
-        db.init_app(app)
+    db.init_app(app)
+
+    @app.cli.command('create-tables')
+    def create_tables():
+        '''
+        Create any missing tables (flask --app app create-tables), for a fresh
+        local database; follow it with `flask db stamp head`.
+        '''
         db.create_all()
 
+    @app.cli.command('check-casts')
+    @click.option('--rebuild', is_flag=True,
+                  help='Recompute the cast of every movie from the actors table.')
+    def check_casts(rebuild):
+        '''Report movies whose stored cast differs from the actors table.'''
+        stale = Movie.stale_casts()
+        click.echo(f'{len(stale)} movies have a stale cast')
+        if rebuild:
+            click.echo(f'rebuilt the cast of {Movie.rebuild_casts()} movies')
+
+    # Schema creation is kept off the import path; set DB_CREATE_ALL=true to
+    # create missing tables at startup, e.g. for a local SQLite database.
+    if os.environ.get('DB_CREATE_ALL', 'false').lower() == 'true':
+        with app.app_context():
+            db.create_all()
+
 class Actor(db.Model):
     __tablename__ = 'actors'
+    __table_args__ = (
+        Index('ix_actors_movie_id_id', 'movie_id', 'id'),
+        Index('ix_actors_name_id', 'name', 'id'),
+        Index('ix_actors_age_id', 'age', 'id'),
+        trigram_index('ix_actors_name_trgm', 'name'),
+        fulltext_index('ix_actors_name_fts', 'name'),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
     age = Column(Integer)
     gender = Column(Enum('Male', 'Female', name='Gender'))
-    movie_id = Column(Integer, db.ForeignKey('movies.id'), nullable=True)
+    movie_id = Column(Integer, db.ForeignKey('movies.id', ondelete='SET NULL'), nullable=True)
+
+    def format(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'age': self.age,
+            'gender': self.gender,
+            'movie_id': self.movie_id
+        }
 
 
 class Movie(db.Model):
     __tablename__ = 'movies'
+    __table_args__ = (
+        Index('ix_movies_title_id', 'title', 'id'),
+        Index('ix_movies_release_date_id', 'release_date', 'id'),
+        trigram_index('ix_movies_title_trgm', 'title'),
+        fulltext_index('ix_movies_title_fts', 'title'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String)
     release_date = Column(DATE)
-    actors = relationship('Actor', backref="movie", lazy=True)
+    # Read model of the cast: actor names ordered by actor id, kept up to
+    # date by the actor handlers through refresh_casts.
+    cast_names = Column(JSON, nullable=False, default=list, server_default=text("'[]'"))
+    # Deleting a movie never loads its actors: remove_movie in app.py nulls
+    # or deletes them in one statement, and the foreign key is ON DELETE
+    # SET NULL for deletes made directly in the database.
+    actors = relationship('Actor', backref="movie", lazy=True, passive_deletes=True)
 
     def format(self):
         return {
             'title': self.title,
             'release_date': self.release_date,
-            'actors': list(map(lambda actor: actor.name, self.actors))
-        }
\ No newline at end of file
+            'actors': list(self.cast_names or [])
+        }
+
+    @classmethod
+    def refresh_casts(cls, movie_ids):
+        '''
+        Recompute `cast_names` of `movie_ids` from the actors table in the
+        current transaction. The movie rows are locked first, so concurrent
+        writers to the same cast are applied one after the other.
+        '''
+        ids = sorted({id for id in movie_ids if id is not None})
+        if not ids:
+            return
+        db.session.execute(select(cls.id).where(cls.id.in_(ids))
+                           .order_by(cls.id).with_for_update())
+        casts = {id: [] for id in ids}
+        rows = db.session.execute(select(Actor.movie_id, Actor.name)
+                                  .where(Actor.movie_id.in_(ids)).order_by(Actor.id))
+        for movie_id, name in rows:
+            casts[movie_id].append(name)
+        db.session.execute(update(cls), [
+            {'id': id, 'cast_names': names} for id, names in casts.items()
+        ])
+
+    @classmethod
+    def rebuild_casts(cls, batch_size=None):
+        '''
+        Recompute `cast_names` of every movie from scratch, committing every
+        `batch_size` movies. Returns the number of movies.
+        '''
+        batch_size = batch_size or CAST_REBUILD_BATCH_SIZE
+        ids = db.session.execute(select(cls.id).order_by(cls.id)).scalars().all()
+        for start in range(0, len(ids), batch_size):
+            cls.refresh_casts(ids[start:start + batch_size])
+            DataVersion.bump('movies')
+            db.session.commit()
+        return len(ids)
+
+    @classmethod
+    def stale_casts(cls):
+        '''Return the ids of the movies whose `cast_names` are out of date.'''
+        casts = {}
+        rows = db.session.execute(select(Actor.movie_id, Actor.name)
+                                  .where(Actor.movie_id.is_not(None)).order_by(Actor.id))
+        for movie_id, name in rows:
+            casts.setdefault(movie_id, []).append(name)
+        return [id for id, names in db.session.execute(select(cls.id, cls.cast_names))
+                if list(names or []) != casts.get(id, [])]
+
+    def export(self):
+        movie = self.format()
+        movie['id'] = self.id
+        if self.release_date is not None:
+            movie['release_date'] = self.release_date.isoformat()
+        return movie
+
+
+class DataVersion(db.Model):
+    '''
+    Change counter per table, bumped by every handler that writes to it.
+
+    It lives in the database so all gunicorn workers see the same value and
+    conditional GETs can be answered from this one small table.
+    '''
+    __tablename__ = 'data_versions'
+
+    name = Column(String(32), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    @classmethod
+    def bump(cls, *names):
+        '''
+        Increment the versions of `names` in the current transaction. The
+        rows are upserted, so two first writes to a table cannot both try
+        to insert its row.
+        '''
+        now = datetime.now(timezone.utc)
+        upsert = UPSERTS[db.session.get_bind().dialect.name](cls).values([
+            {'name': name, 'version': 1, 'updated_at': now} for name in sorted(names)
+        ])
+        db.session.execute(upsert.on_conflict_do_update(
+            index_elements=[cls.name],
+            set_={'version': cls.version + 1, 'updated_at': upsert.excluded.updated_at},
+        ))
+
+    @classmethod
+    def current(cls, *names):
+        '''Return {name: (version, updated_at)} for `names`.'''
+        rows = db.session.execute(
+            select(cls.name, cls.version, cls.updated_at).where(cls.name.in_(names))
+        )
+        versions = {name: (0, None) for name in names}
+        for name, version, updated_at in rows:
+            if updated_at is not None and updated_at.tzinfo is None:
+                updated_at = updated_at.replace(tzinfo=timezone.utc)
+            versions[name] = (version, updated_at)
+        return versions
+
+
+class Job(db.Model):
+    '''
+    A background job and its outcome. Jobs are queued by the API, run by
+    `jobs.run`, and polled through GET /jobs/<id>.
+
+    An Idempotency-Key sent with the request is stored per token subject,
+    so retrying the request returns the job it already created.
+    '''
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        UniqueConstraint('subject', 'idempotency_key', name='uq_jobs_subject_idempotency_key'),
+    )
+
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(32), nullable=False)
+    status = Column(String(16), nullable=False, default='queued')
+    subject = Column(String(255))
+    idempotency_key = Column(String(255))
+    fingerprint = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    def format(self):
+        def iso(value):
+            return value.isoformat() if value is not None else None
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': iso(self.created_at),
+            'started_at': iso(self.started_at),
+            'finished_at': iso(self.finished_at)
+        }
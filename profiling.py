@@ -0,0 +1,120 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from auth import check_permissions, get_verified_payload
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOP_FUNCTIONS = int(os.environ.get('PROFILE_TOP_FUNCTIONS', 30))
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PERMISSION = 'profile:requests'
+
+
+## SQL Capture
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'profile_statements' in g:
+        conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if (has_request_context() and 'profile_statements' in g
+            and conn.info.get('profile_start')):
+        elapsed = time.perf_counter() - conn.info['profile_start'].pop()
+        g.profile_statements.append({
+            'statement': statement,
+            'duration_ms': round(elapsed * 1000, 3)
+        })
+
+
+## Reports
+
+def build_report(profiler, response):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    return {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - g.profile_start) * 1000, 3),
+        'statements': g.profile_statements,
+        'profile': stream.getvalue()
+    }
+
+
+def store_report(profiler, report, directory=None):
+    '''
+    Write the report as JSON and the raw cProfile stats as a `.prof` file
+    (readable with `pstats` or snakeviz). Returns the common file stem.
+    '''
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = re.sub(r'[^\w]+', '_', request.path).strip('_') or 'index'
+    stem = os.path.join(directory, f'{time.time_ns()}-{request.method}-{name}-{os.getpid()}')
+    profiler.dump_stats(stem + '.prof')
+    with open(stem + '.json', 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    return stem
+
+
+## Flask Integration
+
+def install_profiler(app):
+    '''
+    Profile selected requests with cProfile and record their SQL statements.
+
+    A request is profiled when it sends the `X-Profile` header with a token
+    holding the `profile:requests` permission, in which case the response
+    body is replaced by the report, or when it is picked by
+    PROFILE_SAMPLE_RATE, in which case the report is written to PROFILE_DIR.
+
+    Nothing is registered unless PROFILING_ENABLED is true, so a disabled
+    profiler adds no work to any request.
+    '''
+    if not PROFILING_ENABLED:
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        requested = PROFILE_HEADER in request.headers
+        if requested:
+            check_permissions(PROFILE_PERMISSION, get_verified_payload())
+        elif random.random() >= PROFILE_SAMPLE_RATE:
+            return
+        g.profile_requested = requested
+        g.profile_statements = []
+        g.profile_start = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        report = build_report(profiler, response)
+        g.pop('profile_statements')
+        if not g.profile_requested:
+            store_report(profiler, report)
+            return response
+        return jsonify(report)
+
+    @app.teardown_request
+    def stop_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
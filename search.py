@@ -0,0 +1,197 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from sqlalchemy import func, literal, literal_column, select, text, union_all
+from models import db, Actor, Movie
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# table name -> (hit type, indexed column)
+SEARCHABLE = {
+    'actors': ('actor', 'name'),
+    'movies': ('movie', 'title'),
+}
+
+# The Postgres full-text indexes declared by `fulltext_index` in models.py.
+FULLTEXT_INDEXES = ('ix_actors_name_fts', 'ix_movies_title_fts')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+## In-memory Index
+
+class InvertedIndex:
+    '''
+    Pure-Python inverted index over actor names and movie titles, used when
+    the database is not Postgres (SQLite, tests).
+
+    Every query term must match a token of the document, either exactly or
+    as a prefix. Exact matches rank higher than prefix matches.
+    '''
+
+    def __init__(self):
+        self._postings = {}
+        self._tokens = []
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind, id, text):
+        with self._lock:
+            self._remove((kind, id))
+            tokens = set(tokenize(text))
+            self._documents[(kind, id)] = (text, tokens)
+            for token in tokens:
+                if token not in self._postings:
+                    self._postings[token] = set()
+                    insort(self._tokens, token)
+                self._postings[token].add((kind, id))
+
+    def remove(self, kind, id):
+        with self._lock:
+            self._remove((kind, id))
+
+    def _remove(self, key):
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        for token in document[1]:
+            postings = self._postings[token]
+            postings.discard(key)
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+    def _matches(self, term):
+        '''Return {key: score} for the documents matching `term`.'''
+        scores = {}
+        start = bisect_left(self._tokens, term)
+        for token in self._tokens[start:]:
+            if not token.startswith(term):
+                break
+            score = 1.0 if token == term else 0.5
+            for key in self._postings[token]:
+                scores[key] = max(scores.get(key, 0), score)
+        return scores
+
+    def search(self, terms):
+        '''Return [(kind, id, text, rank)] for documents matching all terms.'''
+        with self._lock:
+            scores = None
+            for term in terms:
+                matches = self._matches(term)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {key: scores[key] + score
+                              for key, score in matches.items() if key in scores}
+                if not scores:
+                    return []
+            return [(kind, id, self._documents[(kind, id)][0], score / len(terms))
+                    for (kind, id), score in scores.items()]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._tokens.clear()
+            self._documents.clear()
+
+    def __len__(self):
+        return len(self._documents)
+
+
+## Search Index
+
+def tsvector(column):
+    return func.to_tsvector(literal_column("'simple'"),
+                            func.coalesce(column, literal_column("''")))
+
+
+class SearchIndex:
+    '''
+    Ranked search over actor names and movie titles.
+
+    On Postgres it queries the `to_tsvector` GIN expression indexes, which
+    the database keeps up to date. On other databases it uses an
+    `InvertedIndex` loaded from the tables on first use and updated by the
+    write handlers through `add` and `remove`.
+    '''
+
+    def __init__(self):
+        self.memory = InvertedIndex()
+        self._loaded = False
+
+    def uses_postgres(self):
+        return db.engine.dialect.name == 'postgresql'
+
+    def rebuild(self):
+        self.memory.clear()
+        for id, name in db.session.execute(select(Actor.id, Actor.name)):
+            self.memory.add('actor', id, name)
+        for id, title in db.session.execute(select(Movie.id, Movie.title)):
+            self.memory.add('movie', id, title)
+        self._loaded = True
+
+    def reindex(self):
+        '''
+        Rebuild the index from the tables: REINDEX the GIN indexes on
+        Postgres, reload the in-memory index of this process otherwise.
+        '''
+        if self.uses_postgres():
+            for name in FULLTEXT_INDEXES:
+                db.session.execute(text(f'REINDEX INDEX {name}'))
+            db.session.commit()
+        else:
+            self.rebuild()
+
+    def reset(self):
+        self.memory.clear()
+        self._loaded = False
+
+    def add(self, kind, id, text):
+        if self._loaded:
+            self.memory.add(kind, id, text)
+
+    def remove(self, kind, id):
+        if self._loaded:
+            self.memory.remove(kind, id)
+
+    def search(self, q, limit, offset=0):
+        '''
+        Return up to `limit` hits for `q` after skipping `offset`, best first,
+        as dicts with type, id, text and rank.
+        '''
+        terms = tokenize(q)
+        if not terms:
+            return []
+        if self.uses_postgres():
+            rows = self._search_postgres(terms, limit, offset)
+        else:
+            if not self._loaded:
+                self.rebuild()
+            rows = sorted(self.memory.search(terms),
+                          key=lambda hit: (-hit[3], hit[0], hit[1]))
+            rows = rows[offset:offset + limit]
+        return [{'type': kind, 'id': id, 'text': text, 'rank': round(float(rank), 4)}
+                for kind, id, text, rank in rows]
+
+    def _search_postgres(self, terms, limit, offset):
+        query = func.to_tsquery(literal_column("'simple'"),
+                                ' & '.join(term + ':*' for term in terms))
+        actors = (select(literal('actor').label('type'), Actor.id,
+                         Actor.name.label('text'),
+                         func.ts_rank(tsvector(Actor.name), query).label('rank'))
+                  .where(tsvector(Actor.name).op('@@')(query)))
+        movies = (select(literal('movie').label('type'), Movie.id,
+                         Movie.title.label('text'),
+                         func.ts_rank(tsvector(Movie.title), query).label('rank'))
+                  .where(tsvector(Movie.title).op('@@')(query)))
+        hits = union_all(actors, movies).subquery()
+        statement = (select(hits.c.type, hits.c.id, hits.c.text, hits.c.rank)
+                     .order_by(hits.c.rank.desc(), hits.c.type, hits.c.id)
+                     .limit(limit).offset(offset))
+        return db.session.execute(statement).all()
+
+
+search_index = SearchIndex()
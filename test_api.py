@@ -0,0 +1,218 @@
+import unittest
+import json
+from datetime import date
+from harness import AppTestCase
+from models import Actor, Movie
+from app import db
+
+
+class CastingAgencyTestCase(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        movies = [Movie(title="Forrest Gumb", release_date=date(1994, 7, 6)),
+                  Movie(title="The Shawshank Redemption", release_date=date(1994, 9, 23))]
+        db.session.add_all(movies)
+        db.session.flush()
+        db.session.add_all([
+            Actor(name="Tom Hanks", age=64, gender='Male', movie_id=movies[0].id),
+            Actor(name="Tim Robbins", age=62, gender='Male', movie_id=movies[1].id),
+            Actor(name="Robin Wright", age=54, gender='Female', movie_id=movies[0].id),
+            Actor(name="Morgan Freeman", age=70, gender='Male', movie_id=movies[1].id),
+        ])
+        Movie.refresh_casts(movie.id for movie in movies)
+        db.session.commit()
+
+        self.assistant_headers = self.auth_headers('assistant')
+        self.director_headers = self.auth_headers('director')
+        self.producer_headers = self.auth_headers('producer')
+
+        self.new_actor = {
+            "name": "Gary Sinise",
+            "age": 66,
+            "gender": 'Male',
+            "movie_id": 1
+        }
+
+        self.new_movie = {
+            "title": "Cast Away",
+            "release_date": "2000-12-22",
+        }
+
+    def test_create_movie(self):
+        res = self.client.post('/movies', json=self.new_movie, headers=self.producer_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['created'])
+
+    def test_create_actor(self):
+        res = self.client.post('/actors', json=self.new_actor, headers=self.director_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['created'])
+
+    def test_get_actors(self):
+        res = self.client.get('/actors', headers=self.assistant_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['actors']), 4)
+
+    def test_get_movies(self):
+        res = self.client.get('/movies', headers=self.assistant_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['movies'][0]['actors'], ["Tom Hanks", "Robin Wright"])
+
+    def test_update_actor(self):
+        res = self.client.patch('/actors/1', json={"age": 65}, headers=self.director_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['updated'])
+        self.assertEqual(db.session.get(Actor, 1).age, 65)
+
+    def test_update_movie(self):
+        res = self.client.patch('/movies/1', json={"title": "Forrest Gump"},
+                                headers=self.producer_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['updated'])
+
+    def test_delete_actor(self):
+        res = self.client.delete('/actors/3', headers=self.producer_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['deleted'])
+        self.assertIsNone(db.session.get(Actor, 3))
+
+    def test_delete_movie(self):
+        res = self.client.delete('/movies/2', headers=self.producer_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['deleted'])
+
+    def test_422_if_actor_creation_fails(self):
+        res = self.client.post('/actors', json={}, headers=self.director_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "Unprocessable")
+
+    def test_422_if_movie_creation_fails(self):
+        res = self.client.post('/movies', json={}, headers=self.producer_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "Unprocessable")
+
+    def test_403_if_actor_deletion_fails(self):
+        res = self.client.delete('/actors/1', headers=self.assistant_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "Forbidden")
+
+    def test_403_if_movie_deletion_fails(self):
+        res = self.client.delete('/movies/1', headers=self.director_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "Forbidden")
+
+    def test_403_if_actor_creation_fails(self):
+        res = self.client.post('/actors', json=self.new_actor, headers=self.assistant_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "Forbidden")
+
+    def test_403_if_movie_creation_fails(self):
+        res = self.client.post('/movies', json=self.new_movie, headers=self.director_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "Forbidden")
+
+    def test_403_if_actor_update_fails(self):
+        res = self.client.patch('/actors/1', json={"age": 65}, headers=self.assistant_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "Forbidden")
+
+    def test_403_if_movie_update_fails(self):
+        res = self.client.patch('/movies/1', json={"title": "Big"}, headers=self.assistant_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "Forbidden")
+
+    def test_404_if_actor_not_found(self):
+        res = self.client.patch('/actors/100', json={"name": "Steve Austen"},
+                                headers=self.director_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "Resource Not Found")
+
+    def test_404_if_movie_not_found(self):
+        res = self.client.patch('/movies/100', json={"title": "The Matrix"},
+                                headers=self.producer_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "Resource Not Found")
+
+    def test_405_if_actor_creation_not_allowed(self):
+        res = self.client.post('/actors/1', json=self.new_actor, headers=self.assistant_headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 405)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "Method Not Allowed")
+
+    def test_401_if_no_auth_header(self):
+        res = self.client.get('/actors', headers={})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "authorization_header_missing")
+
+    def test_401_if_no_bearer_token(self):
+        token = self.assistant_headers['Authorization'].split()[1]
+        res = self.client.get('/actors', headers={"Authorization": token})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message']['code'], "invalid_header")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,918 @@
+import gzip
+import json
+import os
+import unittest
+import tempfile
+import threading
+from datetime import date, timedelta
+
+from harness import AppTestCase, ROLES
+from unittest.mock import patch
+from sqlalchemy import create_engine, exc
+import auth
+import metrics
+import profiling
+import json_provider
+import compression
+import jobs
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from cache import response_cache, SharedBackend
+from search import InvertedIndex
+from models import engine_options, Movie, Actor, DataVersion, Job
+from app import create_app, db, encode_cursor
+
+ALL_PERMISSIONS = ROLES['producer']
+
+
+class OfflineAppTestCase(AppTestCase):
+    '''API tests with an all-permissions token and helpers to seed data.'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.token = cls.signer.token(ALL_PERMISSIONS)
+
+    @property
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def seed(self, movies=3, actors_per_movie=4):
+        ids = []
+        for m in range(movies):
+            movie = Movie(title=f'Movie {m}', release_date=date(2000, 1, m + 1))
+            db.session.add(movie)
+            db.session.flush()
+            ids.append(movie.id)
+            for a in range(actors_per_movie):
+                db.session.add(Actor(name=f'Actor {m}-{a}', age=30 + a,
+                                     gender='Female', movie_id=movie.id))
+        Movie.refresh_casts(ids)
+        db.session.commit()
+        db.session.expunge_all()
+
+    def seed_cast(self):
+        movies = [Movie(title='Forrest Gump', release_date=date(1994, 7, 6)),
+                  Movie(title='The Shawshank Redemption', release_date=date(1994, 9, 23)),
+                  Movie(title='Cast Away', release_date=date(2000, 12, 22))]
+        db.session.add_all(movies)
+        db.session.flush()
+        db.session.add_all([
+            Actor(name='Tom Hanks', age=64, gender='Male', movie_id=movies[0].id),
+            Actor(name='Robin Wright', age=54, gender='Female', movie_id=movies[0].id),
+            Actor(name='Tim Robbins', age=62, gender='Male', movie_id=movies[1].id),
+            Actor(name='Morgan Freeman', age=70, gender='Male', movie_id=movies[1].id),
+            Actor(name='Helen Hunt', age=60, gender='Female', movie_id=movies[2].id),
+        ])
+        Movie.refresh_casts(movie.id for movie in movies)
+        db.session.commit()
+
+
+class MovieQueryCountTestCase(OfflineAppTestCase):
+
+    def test_get_movies_query_count_is_constant(self):
+        response_cache.backend = None
+        self.seed(movies=2)
+        with self.count_queries() as small:
+            res = self.client.get('/movies', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+
+        db.drop_all()
+        db.create_all()
+        self.seed(movies=20)
+        with self.count_queries() as large:
+            res = self.client.get('/movies', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.get_json()['movies']), 20)
+        self.assertEqual(len(small), len(large))
+        # data version lookup, movies with their precomputed casts
+        self.assertLessEqual(len(large), 2)
+
+    def test_get_movies_includes_cast(self):
+        self.seed(movies=1, actors_per_movie=2)
+        data = self.client.get('/movies', headers=self.headers).get_json()
+        self.assertEqual(data['movies'][0]['actors'], ['Actor 0-0', 'Actor 0-1'])
+
+
+class CastReadModelTestCase(OfflineAppTestCase):
+
+    def casts(self):
+        movies = self.client.get('/movies', headers=self.headers).get_json()['movies']
+        return {movie['title']: movie['actors'] for movie in movies}
+
+    def test_actor_writes_update_casts(self):
+        self.seed(movies=2, actors_per_movie=2)
+        self.client.post('/actors', json={'name': 'New', 'age': 30, 'gender': 'Male',
+                                          'movie_id': 1}, headers=self.headers)
+        self.client.post('/actors/bulk', json=[{'name': 'Bulk', 'age': 30,
+                                                'gender': 'Male', 'movie_id': 2}],
+                         headers=self.headers)
+        self.client.patch('/actors/1', json={'name': 'Renamed'}, headers=self.headers)
+        self.client.patch('/actors/2', json={'movie_id': 2}, headers=self.headers)
+        self.client.delete('/actors/3', headers=self.headers)
+        self.assertEqual(self.casts(), {
+            'Movie 0': ['Renamed', 'New'],
+            'Movie 1': ['Actor 0-1', 'Actor 1-1', 'Bulk'],
+        })
+        self.assertEqual(Movie.stale_casts(), [])
+
+    def test_reassign_to_unknown_movie(self):
+        self.seed(movies=1, actors_per_movie=1)
+        res = self.client.patch('/actors/1', json={'movie_id': 99}, headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+        res = self.client.patch('/actors/1', json={'movie_id': None}, headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.casts(), {'Movie 0': []})
+
+    def test_update_rejects_bad_bodies(self):
+        self.seed(movies=1, actors_per_movie=1)
+        for body in ([], None, {'movie_id': True}, {'movie_id': '1'}):
+            res = self.client.patch('/actors/1', data=json.dumps(body),
+                                    content_type='application/json', headers=self.headers)
+            self.assertEqual(res.status_code, 422, body)
+        self.assertEqual(self.casts(), {'Movie 0': ['Actor 0-0']})
+
+    def test_check_and_rebuild(self):
+        self.seed(movies=2, actors_per_movie=2)
+        db.session.add(Actor(name='Direct', age=40, gender='Male', movie_id=2))
+        db.session.commit()
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['check-casts'])
+        self.assertIn('1 movies have a stale cast', result.output)
+        result = runner.invoke(args=['check-casts', '--rebuild'])
+        self.assertIn('rebuilt the cast of 2 movies', result.output)
+        self.assertEqual(Movie.stale_casts(), [])
+        self.assertEqual(self.casts()['Movie 1'], ['Actor 1-0', 'Actor 1-1', 'Direct'])
+
+
+class PaginationTestCase(OfflineAppTestCase):
+
+    def test_actors_keyset_pages(self):
+        self.seed(movies=2, actors_per_movie=3)
+        names, after = [], None
+        for _ in range(4):
+            url = '/actors?limit=4' + (f'&after={after}' if after else '')
+            data = self.client.get(url, headers=self.headers).get_json()
+            names += data['actors']
+            after = data['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(len(names), 6)
+        self.assertEqual(names[0], 'Actor 0-0')
+        self.assertIsNone(after)
+
+    def test_page_is_stable_under_inserts(self):
+        self.seed(movies=3, actors_per_movie=0)
+        first = self.client.get('/movies?limit=2', headers=self.headers).get_json()
+        db.session.add(Movie(title='Newer', release_date=date(2020, 1, 1)))
+        db.session.commit()
+        second = self.client.get(f"/movies?limit=2&after={first['next_cursor']}",
+                                 headers=self.headers).get_json()
+        titles = [m['title'] for m in first['movies'] + second['movies']]
+        self.assertEqual(titles, ['Movie 0', 'Movie 1', 'Movie 2', 'Newer'])
+
+    def test_full_list_without_page_args(self):
+        self.seed(movies=2, actors_per_movie=1)
+        data = self.client.get('/actors', headers=self.headers).get_json()
+        self.assertEqual(len(data['actors']), 2)
+        self.assertNotIn('next_cursor', data)
+
+    def test_422_on_bad_page_args(self):
+        res = self.client.get('/actors?limit=abc', headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+        res = self.client.get('/movies?limit=0', headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+
+
+class ExportTestCase(OfflineAppTestCase):
+
+    def test_export_actors_ndjson(self):
+        self.seed(movies=2, actors_per_movie=2)
+        res = self.client.get('/export/actors.ndjson', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(res.is_streamed)
+        rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [1, 2, 3, 4])
+        self.assertEqual(rows[0]['name'], 'Actor 0-0')
+
+    def test_export_movies_ndjson(self):
+        self.seed(movies=2, actors_per_movie=1)
+        res = self.client.get('/export/movies.ndjson', headers=self.headers)
+        rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual(rows[1], {'id': 2, 'title': 'Movie 1',
+                                   'release_date': '2000-01-02',
+                                   'actors': ['Actor 1-0']})
+
+    def test_export_requires_permission(self):
+        token = self.signer.token(['get:movies'])
+        res = self.client.get('/export/actors.ndjson',
+                              headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(res.status_code, 403)
+
+
+class SearchTestCase(OfflineAppTestCase):
+
+    def actors(self, query):
+        res = self.client.get('/actors?' + query, headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        return res.get_json()['actors']
+
+    def test_filter_actors(self):
+        self.seed_cast()
+        self.assertCountEqual(self.actors('name=t'), ['Tom Hanks', 'Tim Robbins'])
+        self.assertEqual(self.actors('gender=Female&sort=name'), ['Helen Hunt', 'Robin Wright'])
+        self.assertEqual(self.actors('age_min=60&age_max=64&sort=-age'),
+                         ['Tom Hanks', 'Tim Robbins', 'Helen Hunt'])
+        self.assertEqual(self.actors('movie_id=2&sort=name'), ['Morgan Freeman', 'Tim Robbins'])
+
+    def test_name_prefix_is_escaped(self):
+        self.seed_cast()
+        self.assertEqual(self.actors('name=%25'), [])
+
+    def test_filter_movies(self):
+        self.seed_cast()
+        res = self.client.get('/movies?released_after=1994-08-01&sort=-release_date',
+                              headers=self.headers)
+        movies = res.get_json()['movies']
+        self.assertEqual([m['title'] for m in movies], ['Cast Away', 'The Shawshank Redemption'])
+        self.assertEqual(movies[1]['actors'], ['Tim Robbins', 'Morgan Freeman'])
+
+    def test_sorted_keyset_pages(self):
+        self.seed_cast()
+        names, after = [], None
+        for _ in range(5):
+            query = 'sort=name&limit=2' + (f'&after={after}' if after else '')
+            data = self.client.get('/actors?' + query, headers=self.headers).get_json()
+            names += data['actors']
+            after = data['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 5)
+
+    def test_sorted_keyset_pages_with_nulls(self):
+        self.seed(movies=1, actors_per_movie=3)
+        db.session.add_all([Actor(name=f'Unknown {a}', gender='Male', movie_id=1)
+                            for a in range(3)])
+        db.session.commit()
+        for sort, expected in [('age', ['Actor 0-0', 'Actor 0-1', 'Actor 0-2',
+                                        'Unknown 0', 'Unknown 1', 'Unknown 2']),
+                               ('-age', ['Unknown 2', 'Unknown 1', 'Unknown 0',
+                                         'Actor 0-2', 'Actor 0-1', 'Actor 0-0'])]:
+            names, after = [], None
+            for _ in range(5):
+                query = f'sort={sort}&limit=2' + (f'&after={after}' if after else '')
+                data = self.client.get('/actors?' + query, headers=self.headers).get_json()
+                names += data['actors']
+                after = data['next_cursor']
+                if after is None:
+                    break
+            self.assertEqual(names, expected)
+
+    def test_sorted_movie_pages_by_date(self):
+        self.seed_cast()
+        first = self.client.get('/movies?sort=-release_date&limit=1',
+                                headers=self.headers).get_json()
+        second = self.client.get(f"/movies?sort=-release_date&limit=2&after={first['next_cursor']}",
+                                 headers=self.headers).get_json()
+        self.assertEqual([m['title'] for m in second['movies']],
+                         ['The Shawshank Redemption', 'Forrest Gump'])
+
+    def test_422_on_unknown_sort_or_bad_filter(self):
+        for query in ['sort=gender', 'sort=password', 'age_min=old', 'gender=Other',
+                      'sort=name&limit=1&after=garbage']:
+            res = self.client.get('/actors?' + query, headers=self.headers)
+            self.assertEqual(res.status_code, 422, query)
+        res = self.client.get('/movies?released_before=yesterday', headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+
+    def test_422_on_cursor_of_wrong_type(self):
+        self.seed_cast()
+        for sort, value, key in [('age', [1], 5), ('age', 'old', 5), ('age', True, 5),
+                                 ('name', 3, 5), ('age', 30, '5'), ('age', 30, 1.5)]:
+            after = encode_cursor(value, key)
+            res = self.client.get(f'/actors?sort={sort}&limit=1&after={after}',
+                                  headers=self.headers)
+            self.assertEqual(res.status_code, 422, (sort, value, key))
+        for value in [{'y': 1994}, 1994]:
+            after = encode_cursor(value, 1)
+            res = self.client.get(f'/movies?sort=release_date&limit=1&after={after}',
+                                  headers=self.headers)
+            self.assertEqual(res.status_code, 422, value)
+
+
+class FullTextSearchTestCase(OfflineAppTestCase):
+
+    def search(self, q, **params):
+        res = self.client.get('/search', query_string={'q': q, **params},
+                              headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        return res.get_json()
+
+    def test_ranked_hits_for_actors_and_movies(self):
+        self.seed_cast()
+        self.client.post('/actors', json={'name': 'Cast Member', 'age': 30, 'gender': 'Male'},
+                         headers=self.headers)
+        hits = self.search('cast')['results']
+        self.assertEqual([(hit['type'], hit['text']) for hit in hits],
+                         [('actor', 'Cast Member'), ('movie', 'Cast Away')])
+        hits = self.search('ro')['results']
+        self.assertEqual({hit['text'] for hit in hits}, {'Robin Wright', 'Tim Robbins'})
+
+    def test_all_terms_must_match(self):
+        self.seed_cast()
+        hits = self.search('t ha')['results']
+        self.assertEqual([hit['text'] for hit in hits], ['Tom Hanks'])
+
+    def test_index_follows_writes(self):
+        self.seed_cast()
+        self.assertEqual(len(self.search('hunt')['results']), 1)
+        self.client.patch('/actors/5', json={'name': 'Helen Mirren'}, headers=self.headers)
+        self.assertEqual(self.search('hunt')['results'], [])
+        self.assertEqual(self.search('mirren')['results'][0]['id'], 5)
+        self.client.delete('/movies/3', headers=self.headers)
+        self.assertEqual(self.search('away')['results'], [])
+        self.client.post('/movies/bulk', json=[{'title': 'Big', 'release_date': '1988-06-03'}],
+                         headers=self.headers)
+        self.assertEqual(self.search('big')['results'][0]['type'], 'movie')
+
+    def test_pages(self):
+        self.seed(movies=3, actors_per_movie=4)
+        first = self.search('actor', limit=5)
+        second = self.search('actor', limit=5, page=3)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(second['results']), 2)
+        self.assertFalse(second['has_more'])
+
+    def test_422_without_query(self):
+        res = self.client.get('/search?q=', headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+
+    def test_inverted_index_remove(self):
+        index = InvertedIndex()
+        index.add('actor', 1, 'Tom Hanks')
+        index.add('actor', 2, 'Tom Cruise')
+        index.remove('actor', 1)
+        self.assertEqual(index.search(['tom']), [('actor', 2, 'Tom Cruise', 1.0)])
+        self.assertEqual(index.search(['hanks']), [])
+
+
+class BulkCreateTestCase(OfflineAppTestCase):
+
+    def test_bulk_create_actors_reports_each_item(self):
+        items = [
+            {'name': 'A', 'age': 30, 'gender': 'Male'},
+            {'name': 'B', 'age': 31},
+            {'name': 'C', 'age': 32, 'gender': 'Female'},
+            {'name': 'D', 'age': 33, 'gender': 'Other'}
+        ]
+        res = self.client.post('/actors/bulk', json=items, headers=self.headers)
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(data['success'])
+        self.assertEqual((data['created'], data['failed']), (2, 2))
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['created', 'invalid', 'created', 'invalid'])
+        self.assertEqual(Actor.query.count(), 2)
+
+    def test_bulk_create_rejects_wrong_types_per_item(self):
+        self.seed(movies=1, actors_per_movie=0)
+        items = [
+            {'name': 'A', 'age': 'old', 'gender': 'Male'},
+            {'name': 'B', 'age': True, 'gender': 'Male'},
+            {'name': 'C', 'age': 30, 'gender': 'Male', 'movie_id': '1'},
+            {'name': 'D', 'age': 30, 'gender': 'Male', 'movie_id': 99},
+            {'name': 42, 'age': 30, 'gender': 'Male'},
+            {'name': 'E', 'age': 30, 'gender': 'Male', 'movie_id': 1},
+        ]
+        data = self.client.post('/actors/bulk', json=items, headers=self.headers).get_json()
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['invalid'] * 5 + ['created'])
+        self.assertEqual(data['results'][0]['error'], 'age must be an integer')
+        self.assertEqual(data['results'][4]['error'], 'name must be a string')
+        self.assertEqual(Actor.query.count(), 1)
+
+        items = [{'title': 'A', 'release_date': '1994-07-06'},
+                 {'title': ['B'], 'release_date': '1994-07-06'},
+                 {'title': 'C', 'release_date': '1994-07-06'}]
+        data = self.client.post('/movies/bulk', json=items, headers=self.headers).get_json()
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['created', 'invalid', 'created'])
+        self.assertEqual(data['results'][1]['error'], 'title must be a string')
+
+    def test_bulk_create_movies_in_batches(self):
+        items = [{'title': f'Movie {i}', 'release_date': '1994-07-06'} for i in range(5)]
+        with patch('app.BULK_BATCH_SIZE', 2), \
+                patch.object(db.session, 'commit', wraps=db.session.commit) as commit:
+            res = self.client.post('/movies/bulk', json=items, headers=self.headers)
+        data = res.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual([r['id'] for r in data['results']], [1, 2, 3, 4, 5])
+        self.assertEqual(commit.call_count, 3)
+
+    def test_bulk_create_rejects_non_list(self):
+        res = self.client.post('/movies/bulk', json={'title': 'x'}, headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+
+
+class JSONProviderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.fast = json_provider.FastJSONProvider(self.app)
+        self.default = DefaultJSONProvider(self.app)
+
+    def assertSameBody(self, obj):
+        with self.app.app_context():
+            self.assertEqual(self.fast.response(obj).get_data(),
+                             self.default.response(obj).get_data())
+
+    def test_output_matches_default_provider(self):
+        self.assertSameBody({
+            'title': 'Am\u00e9lie \U0001f3ac \u2028 \x7f \x00 "quoted" \\ /',
+            'release_date': date(2001, 4, 25),
+            'actors': ['Audrey Tautou', 'Mathieu Kassovitz'],
+            'rank': 0.0608, 'count': 3, 'success': True, 'next_cursor': None,
+            'nested': {'z': (1, 2), 'a': []},
+        })
+        self.assertSameBody([{'b': 1, 'a': 2}] * 3)
+        self.assertSameBody({'a': 'x\x7fy'})
+
+    def test_dates_match_http_date(self):
+        self.assertSameBody([date(1, 1, 1), date(999, 2, 28), date(1994, 7, 6),
+                             date(2024, 2, 29), date(9999, 12, 31)])
+
+    def test_falls_back_for_values_orjson_rejects(self):
+        self.assertSameBody({'big': 2 ** 70})
+        self.assertSameBody({2: 'int keys', 1: 'sorted as ints'})
+
+    def test_stdlib_mode(self):
+        with patch.object(json_provider, 'JSON_PROVIDER', 'stdlib'):
+            self.assertFalse(json_provider.FastJSONProvider(self.app).fast)
+
+    def test_api_uses_provider(self):
+        self.assertIsInstance(create_app(test_config=True).json,
+                              json_provider.FastJSONProvider)
+
+
+class CompressionTestCase(OfflineAppTestCase):
+
+    def get(self, path, encoding):
+        return self.client.get(path, headers={**self.headers, 'Accept-Encoding': encoding})
+
+    def test_negotiates_brotli_and_gzip(self):
+        self.seed(movies=20, actors_per_movie=10)
+        plain = self.client.get('/actors', headers=self.headers)
+        self.assertGreater(len(plain.data), compression.COMPRESS_MIN_SIZE)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.vary)
+
+        br = self.get('/actors', 'gzip, br')
+        self.assertEqual(br.headers['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(br.data), plain.data)
+        gz = self.get('/actors', 'br;q=0.5, gzip')
+        self.assertEqual(gz.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gz.data), plain.data)
+        self.assertEqual(int(gz.headers['Content-Length']), len(gz.data))
+        self.assertNotIn('Content-Encoding', self.get('/actors', 'identity').headers)
+
+    def test_small_bodies_are_not_compressed(self):
+        res = self.get('/actors', 'gzip')
+        self.assertLess(len(res.data), compression.COMPRESS_MIN_SIZE)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_streamed_export_is_compressed(self):
+        self.seed(movies=2, actors_per_movie=2)
+        res = self.get('/export/actors.ndjson', 'gzip')
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        rows = gzip.decompress(res.data).decode().splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [1, 2, 3, 4])
+
+    def test_compressed_body_is_cached(self):
+        self.seed(movies=20, actors_per_movie=10)
+        first = self.get('/actors', 'gzip')
+        with patch.object(compression, 'compress') as compress:
+            second = self.get('/actors', 'gzip')
+        compress.assert_not_called()
+        self.assertEqual(first.data, second.data)
+        self.client.post('/actors', json={'name': 'A', 'age': 30, 'gender': 'Male'},
+                         headers=self.headers)
+        actors = json.loads(gzip.decompress(self.get('/actors', 'gzip').data))['actors']
+        self.assertIn('A', actors)
+
+    def test_conditional_get_with_compression(self):
+        self.seed(movies=20, actors_per_movie=10)
+        first = self.get('/actors', 'gzip')
+        self.assertTrue(first.headers['ETag'].startswith('W/'))
+        res = self.client.get('/actors', headers={**self.headers, 'Accept-Encoding': 'gzip',
+                                                  'If-None-Match': first.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], first.headers['ETag'])
+
+
+class JobsTestCase(OfflineAppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.original_runner = jobs.runner
+        jobs.runner = jobs.LocalRunner(workers=0)
+
+    def tearDown(self):
+        jobs.runner = self.original_runner
+        super().tearDown()
+
+    def queue(self, method, path, key=None, **kwargs):
+        headers = {**self.headers, 'Prefer': 'respond-async'}
+        if key is not None:
+            headers['Idempotency-Key'] = key
+        return self.client.open(path, method=method, headers=headers, **kwargs)
+
+    def test_async_import(self):
+        items = [{'name': 'A', 'age': 30, 'gender': 'Male'}, {'name': 'B'}]
+        res = self.queue('POST', '/actors/bulk', json=items)
+        self.assertEqual(res.status_code, 202)
+        job = self.client.get(res.headers['Location'], headers=self.headers).get_json()['job']
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual((job['result']['created'], job['result']['failed']), (1, 1))
+        self.assertEqual(self.client.get('/actors', headers=self.headers)
+                         .get_json()['actors'], ['A'])
+
+    def test_idempotency_key(self):
+        items = [{'title': 'M', 'release_date': '1994-07-06'}]
+        first = self.queue('POST', '/movies/bulk', key='import-1', json=items)
+        retry = self.queue('POST', '/movies/bulk', key='import-1', json=items)
+        self.assertEqual(retry.status_code, 202)
+        self.assertEqual(first.get_json()['job']['id'], retry.get_json()['job']['id'])
+        self.assertEqual(Movie.query.count(), 1)
+        other = self.queue('POST', '/movies/bulk', key='import-1', json=items * 2)
+        self.assertEqual(other.status_code, 409)
+
+    def test_async_movie_delete(self):
+        self.seed(movies=1, actors_per_movie=3)
+        res = self.queue('DELETE', '/movies/1')
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(res.get_json()['job']['result'],
+                         {'movie_id': 1, 'policy': 'nullify', 'deleted': True, 'actors': 3})
+        self.assertEqual(Movie.query.count(), 0)
+        self.assertEqual(self.queue('DELETE', '/movies/1').status_code, 404)
+
+    def test_search_rebuild_needs_permission(self):
+        self.assertEqual(self.client.post('/search/rebuild', headers=self.headers).status_code, 403)
+        token = self.signer.token(['rebuild:search'])
+        res = self.client.post('/search/rebuild', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(res.get_json()['job']['status'], 'succeeded')
+
+    def test_job_status_needs_permission_of_job(self):
+        res = self.queue('POST', '/actors/bulk', json=[{'name': 'A'}])
+        token = self.signer.token(['get:actors'])
+        status = self.client.get(res.headers['Location'],
+                                 headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(status.status_code, 403)
+        self.assertEqual(self.client.get('/jobs/missing', headers=self.headers).status_code, 404)
+
+    def test_failed_job(self):
+        def fail(payload):
+            raise RuntimeError('boom')
+        with patch.dict(jobs.HANDLERS, {'fail': ('post:actors', fail)}):
+            job, created = jobs.enqueue('fail', {})
+        self.assertTrue(created)
+        self.assertEqual((job.status, job.error), ('failed', 'RuntimeError'))
+
+    def test_thread_runner(self):
+        jobs.runner = jobs.LocalRunner(workers=2)
+        job, _ = jobs.enqueue('import:actors', [{'name': 'A', 'age': 30, 'gender': 'Male'}])
+        jobs.runner.wait(timeout=10)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Job, job.id).status, 'succeeded')
+        self.assertEqual(Actor.query.count(), 1)
+
+    def test_recover_jobs_of_exited_workers(self):
+        def job(status, **values):
+            row = Job(id=status, kind='import:actors', status=status, fingerprint='',
+                      payload=[{'name': 'A', 'age': 30, 'gender': 'Male'}],
+                      created_at=jobs.utcnow(), **values)
+            db.session.add(row)
+            return row
+        job('queued')
+        job('running', started_at=jobs.utcnow())
+        db.session.commit()
+        self.assertEqual(jobs.recover(), (0, 0))
+
+        later = jobs.utcnow() + timedelta(seconds=jobs.JOBS_TIMEOUT + 1)
+        self.assertEqual(jobs.recover(now=later), (1, 1))
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Job, 'queued').status, 'succeeded')
+        running = db.session.get(Job, 'running')
+        self.assertEqual((running.status, running.error), ('failed', 'WorkerLost'))
+        self.assertEqual(Actor.query.count(), 1)
+
+    def test_recover_leaves_queued_jobs_to_celery(self):
+        db.session.add(Job(id='queued', kind='import:actors', status='queued', fingerprint='',
+                           payload=[], created_at=jobs.utcnow()))
+        db.session.commit()
+        later = jobs.utcnow() + timedelta(seconds=jobs.JOBS_STALE_AFTER + 1)
+        with patch.object(jobs, 'runner', jobs.CeleryRunner()), \
+                patch.object(jobs.run_job, 'delay') as delay:
+            self.assertEqual(jobs.recover(now=later), (0, 0))
+        delay.assert_not_called()
+        self.assertEqual(db.session.get(Job, 'queued').status, 'queued')
+
+    def test_runner_from_env(self):
+        self.assertIsInstance(jobs.runner_from_env({}), jobs.LocalRunner)
+        self.assertIsInstance(jobs.runner_from_env({'JOBS_BROKER_URL': 'amqp://localhost'}),
+                              jobs.CeleryRunner)
+
+
+class MovieDeleteTestCase(OfflineAppTestCase):
+
+    def test_nullify_keeps_actors(self):
+        self.seed(movies=2, actors_per_movie=3)
+        res = self.client.delete('/movies/1', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Actor.query.count(), 6)
+        self.assertEqual(Actor.query.filter_by(movie_id=None).count(), 3)
+        self.assertEqual(db.session.get(Movie, 2).cast_names, ['Actor 1-0', 'Actor 1-1', 'Actor 1-2'])
+
+    def test_cascade_deletes_actors(self):
+        self.seed(movies=2, actors_per_movie=3)
+        self.client.get('/search?q=actor', headers=self.headers)
+        res = self.client.delete('/movies/1?policy=cascade', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Actor.query.count(), 3)
+        self.assertIsNone(Actor.query.filter_by(movie_id=1).first())
+        hits = self.client.get('/search?q=actor', headers=self.headers).get_json()
+        self.assertEqual(len(hits['results']), 3)
+
+    def test_unknown_policy(self):
+        self.seed(movies=1, actors_per_movie=1)
+        res = self.client.delete('/movies/1?policy=orphan', headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Movie.query.count(), 1)
+
+    def test_statements_do_not_grow_with_cast(self):
+        self.seed(movies=3, actors_per_movie=1)
+        self.seed(movies=2, actors_per_movie=50)
+        for policy, small, large in (('nullify', 1, 4), ('cascade', 2, 5)):
+            counts = []
+            for movie_id in (small, large):
+                with self.count_queries() as statements:
+                    res = self.client.delete(f'/movies/{movie_id}?policy={policy}',
+                                             headers=self.headers)
+                self.assertEqual(res.status_code, 200)
+                counts.append(len(statements))
+            self.assertEqual(counts[0], counts[1], policy)
+
+
+class PoolConfigTestCase(unittest.TestCase):
+
+    def test_engine_options_from_environment(self):
+        options = engine_options('postgresql://localhost/agency', {
+            'DB_POOL_SIZE': '20', 'DB_POOL_PRE_PING': 'false', 'DB_STATEMENT_TIMEOUT': '500'
+        })
+        self.assertEqual(options['pool_size'], 20)
+        self.assertFalse(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=500'})
+        self.assertEqual(engine_options('sqlite://', {}), {})
+
+    def test_pool_exhaustion_is_counted(self):
+        engine = create_engine('sqlite://', poolclass=metrics.InstrumentedQueuePool,
+                               pool_size=1, max_overflow=0, pool_timeout=0.01)
+        before = metrics.DB_POOL_EXHAUSTED._value.get()
+        with engine.connect():
+            with self.assertRaises(exc.TimeoutError):
+                engine.connect()
+        self.assertEqual(metrics.DB_POOL_EXHAUSTED._value.get(), before + 1)
+        engine.dispose()
+
+
+class ConditionalGetTestCase(OfflineAppTestCase):
+
+    def test_etag_revalidation(self):
+        self.seed(movies=1, actors_per_movie=1)
+        res = self.client.get('/actors', headers=self.headers)
+        etag = res.headers['ETag']
+
+        with self.count_queries() as statements:
+            res = self.client.get('/actors', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(len(statements), 1)
+
+    def test_write_changes_etag(self):
+        res = self.client.get('/movies', headers=self.headers)
+        etag = res.headers['ETag']
+        self.client.post('/actors', json={'name': 'A', 'age': 30, 'gender': 'Male'},
+                         headers=self.headers)
+        res = self.client.get('/movies', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_if_modified_since(self):
+        self.client.post('/movies', json={'title': 'M', 'release_date': '1994-07-06'},
+                         headers=self.headers)
+        res = self.client.get('/movies', headers=self.headers)
+        res = self.client.get('/movies', headers={
+            **self.headers, 'If-Modified-Since': res.headers['Last-Modified']})
+        self.assertEqual(res.status_code, 304)
+
+    def test_etag_depends_on_query(self):
+        first = self.client.get('/actors?limit=1', headers=self.headers)
+        second = self.client.get('/actors?limit=2', headers=self.headers)
+        self.assertNotEqual(first.headers['ETag'], second.headers['ETag'])
+
+    def test_permission_checked_before_304(self):
+        res = self.client.get('/actors', headers=self.headers)
+        token = self.signer.token(['get:movies'])
+        res = self.client.get('/actors', headers={
+            'Authorization': f'Bearer {token}', 'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 403)
+
+
+class FakeSharedClient:
+    '''Local stand-in for the Redis client used by SharedBackend.'''
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+class ResponseCacheTestCase(OfflineAppTestCase):
+
+    def test_cached_body_skips_database(self):
+        self.seed(movies=2, actors_per_movie=2)
+        first = self.client.get('/movies', headers=self.headers)
+        with self.count_queries() as statements:
+            second = self.client.get('/movies', headers=self.headers)
+        self.assertEqual(first.data, second.data)
+        # only the data version lookup of the conditional GET
+        self.assertEqual(len(statements), 1)
+
+    def test_actor_write_invalidates_both_lists(self):
+        self.client.get('/actors', headers=self.headers)
+        self.client.get('/movies', headers=self.headers)
+        self.client.post('/actors', json={'name': 'A', 'age': 30, 'gender': 'Male'},
+                         headers=self.headers)
+        self.assertEqual(self.client.get('/actors', headers=self.headers)
+                         .get_json()['actors'], ['A'])
+
+    def test_write_from_another_process(self):
+        self.client.get('/actors', headers=self.headers)
+        # what another worker or a job process leaves in the database
+        db.session.add(Actor(name='A', age=30, gender='Male'))
+        DataVersion.bump('actors')
+        db.session.commit()
+        res = self.client.get('/actors', headers=self.headers)
+        self.assertEqual(res.get_json()['actors'], ['A'])
+
+    def test_movie_write_keeps_actor_entries(self):
+        self.client.get('/actors', headers=self.headers)
+        self.client.post('/movies', json={'title': 'M', 'release_date': '1994-07-06'},
+                         headers=self.headers)
+        hits = response_cache.hits
+        self.client.get('/actors', headers=self.headers)
+        self.assertEqual(response_cache.hits, hits + 1)
+        self.assertEqual(len(self.client.get('/movies', headers=self.headers)
+                             .get_json()['movies']), 1)
+
+    def test_query_params_are_part_of_key(self):
+        self.seed(movies=1, actors_per_movie=3)
+        one = self.client.get('/actors?limit=1', headers=self.headers).get_json()
+        two = self.client.get('/actors?limit=2', headers=self.headers).get_json()
+        self.assertEqual((len(one['actors']), len(two['actors'])), (1, 2))
+
+    def test_cache_requires_permission(self):
+        self.client.get('/actors', headers=self.headers)
+        token = self.signer.token(['get:movies'])
+        res = self.client.get('/actors', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(res.status_code, 403)
+
+    def test_shared_backend(self):
+        response_cache.backend = SharedBackend(FakeSharedClient())
+        self.client.get('/actors', headers=self.headers)
+        self.client.post('/actors', json={'name': 'A', 'age': 30, 'gender': 'Male'},
+                         headers=self.headers)
+        hits = response_cache.hits
+        data = self.client.get('/actors', headers=self.headers).get_json()
+        self.assertEqual(data['actors'], ['A'])
+        self.client.get('/actors', headers=self.headers)
+        self.assertEqual(response_cache.hits, hits + 1)
+
+
+class MetricsTestCase(OfflineAppTestCase):
+
+    def sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_and_sql_metrics(self):
+        self.seed(movies=1, actors_per_movie=2)
+        labels = {'method': 'GET', 'route': '/movies'}
+        requests = self.sample('http_requests_total', status='200', **labels)
+        statements = self.sample('db_statements_per_request_sum', route='/movies')
+        self.client.get('/movies', headers=self.headers)
+        self.assertEqual(self.sample('http_requests_total', status='200', **labels),
+                         requests + 1)
+        self.assertGreater(self.sample('http_response_size_bytes_sum', **labels), 0)
+        self.assertGreater(self.sample('db_statements_per_request_sum', route='/movies'),
+                           statements)
+        self.assertEqual(self.sample('http_requests_in_flight'), 0)
+
+    def test_unmatched_routes_share_a_label(self):
+        before = self.sample('http_requests_total', method='GET', route='unmatched',
+                             status='404')
+        self.client.get('/no/such/page')
+        self.client.get('/another/missing/page')
+        self.assertEqual(self.sample('http_requests_total', method='GET',
+                                     route='unmatched', status='404'), before + 2)
+
+    def test_auth_and_cache_metrics(self):
+        auth.token_cache.clear()
+        verified = self.sample('jwt_verify_duration_seconds_count')
+        token_hits = self.sample('cache_requests_total', cache='token', result='hit')
+        response_hits = self.sample('cache_requests_total', cache='response', result='hit')
+        self.client.get('/actors', headers=self.headers)
+        self.client.get('/actors', headers=self.headers)
+        self.assertEqual(self.sample('jwt_verify_duration_seconds_count'), verified + 1)
+        self.assertEqual(self.sample('cache_requests_total', cache='token', result='hit'),
+                         token_hits + 1)
+        self.assertEqual(self.sample('cache_requests_total', cache='response',
+                                     result='hit'), response_hits + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/')
+        res = self.client.get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        self.assertIn(b'http_request_duration_seconds_bucket', res.data)
+        self.assertIn(b'db_pool_checkout_seconds', res.data)
+
+
+class ProfilingTestCase(OfflineAppTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with patch.object(profiling, 'PROFILING_ENABLED', True):
+            super().setUpClass()
+        cls.profile_token = cls.signer.token(ALL_PERMISSIONS + ['profile:requests'])
+
+    def test_profile_report_replaces_body(self):
+        self.seed(movies=2)
+        res = self.client.get('/movies', headers={
+            'Authorization': f'Bearer {self.profile_token}', 'X-Profile': '1'})
+        report = res.get_json()
+        self.assertEqual(report['status'], 200)
+        self.assertEqual(report['path'], '/movies')
+        self.assertTrue(any('FROM movies' in s['statement'] for s in report['statements']))
+        self.assertIn('cumulative', report['profile'])
+
+    def test_sql_outside_app_context(self):
+        errors = []
+
+        def run():
+            try:
+                with create_engine('sqlite://').connect() as conn:
+                    conn.exec_driver_sql('SELECT 1')
+            except Exception as e:
+                errors.append(e)
+
+        # a new thread has no app context, like a script or the harness
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(errors, [])
+
+    def test_profile_requires_permission(self):
+        res = self.client.get('/movies', headers={**self.headers, 'X-Profile': '1'})
+        self.assertEqual(res.status_code, 403)
+        res = self.client.get('/movies', headers={'X-Profile': '1'})
+        self.assertEqual(res.status_code, 401)
+
+    def test_unprofiled_requests_are_unchanged(self):
+        self.seed(movies=1)
+        res = self.client.get('/movies', headers=self.headers)
+        self.assertIn('movies', res.get_json())
+
+    def test_sampled_profile_is_stored(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.object(profiling, 'PROFILE_SAMPLE_RATE', 1.0), \
+                patch.object(profiling, 'PROFILE_DIR', directory):
+            res = self.client.get('/actors', headers=self.headers)
+            self.assertIn('actors', res.get_json())
+            files = sorted(os.listdir(directory))
+        self.assertEqual([f.rsplit('.', 1)[1] for f in files], ['json', 'prof'])
+
+    def test_disabled_profiler_registers_nothing(self):
+        app = create_app(test_config=True)
+        self.assertNotIn('start_profile', [f.__name__ for f in
+                                           app.before_request_funcs.get(None, [])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from flask import Flask, jsonify
+
+import auth
+from auth import JWKSKeyStore, VerifiedTokenCache, AuthError, requires_auth
+from local_auth import LocalSigner
+
+
+class CountingFetcher:
+    def __init__(self, *jwks_keys):
+        self.keys = list(jwks_keys)
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise OSError('JWKS endpoint unreachable')
+        return {'keys': self.keys}
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.signer = LocalSigner('key-1')
+        cls.rotated = LocalSigner('key-2')
+
+    def setUp(self):
+        self.fetcher = CountingFetcher(self.signer.public_jwk)
+        self.store = JWKSKeyStore(self.fetcher, ttl=600, min_refetch_interval=0,
+                                  background=False)
+        self.original_store = auth.jwks_store
+        auth.jwks_store = self.store
+
+    def tearDown(self):
+        auth.jwks_store = self.original_store
+
+    def test_keys_are_fetched_once(self):
+        for _ in range(5):
+            self.assertEqual(self.store.get_key('key-1')['kid'], 'key-1')
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_unknown_kid_forces_one_refetch(self):
+        self.store.get_key('key-1')
+        self.fetcher.keys.append(self.rotated.public_jwk)
+        self.assertEqual(self.store.get_key('key-2')['kid'], 'key-2')
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        self.store.min_refetch_interval = 60
+        self.store.get_key('key-1')
+        self.assertIsNone(self.store.get_key('missing'))
+        self.assertIsNone(self.store.get_key('missing'))
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_stale_keys_served_when_fetch_fails(self):
+        self.store.ttl = 0
+        self.store.get_key('key-1')
+        self.fetcher.fail = True
+        self.assertEqual(self.store.get_key('key-1')['kid'], 'key-1')
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_background_refresh_after_ttl(self):
+        self.store.ttl = 0
+        self.store.background = True
+        self.store.get_key('key-1')
+        self.fetcher.keys.append(self.rotated.public_jwk)
+        self.assertEqual(self.store.get_key('key-1')['kid'], 'key-1')
+        for thread in threading.enumerate():
+            if thread.name == 'jwks-refresh':
+                thread.join(timeout=5)
+        self.assertEqual(self.fetcher.calls, 2)
+        self.assertIn('key-2', self.store._keys)
+
+    def test_verify_decode_jwt_against_local_jwks(self):
+        token = self.signer.token(['get:actors'])
+        payload = auth.verify_decode_jwt(token)
+        self.assertEqual(payload['permissions'], ['get:actors'])
+
+    def test_verify_decode_jwt_rejects_unknown_key(self):
+        token = self.rotated.token(['get:actors'])
+        self.fetcher.fail = True
+        with self.assertRaises(AuthError) as error:
+            auth.verify_decode_jwt(token)
+        self.assertEqual(error.exception.status_code, 400)
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.signer = LocalSigner('key-1')
+        cls.app = Flask(__name__)
+
+        @cls.app.route('/actors')
+        @requires_auth('get:actors')
+        def get_actors(payload):
+            return jsonify({'success': True})
+
+        @cls.app.errorhandler(AuthError)
+        def auth_error(error):
+            return jsonify({'success': False, 'message': error.error}), error.status_code
+
+        cls.client = cls.app.test_client()
+
+    def setUp(self):
+        self.cache = VerifiedTokenCache(maxsize=2)
+        self.original_store = auth.jwks_store
+        self.original_cache = auth.token_cache
+        auth.jwks_store = JWKSKeyStore(CountingFetcher(self.signer.public_jwk), background=False)
+        auth.token_cache = self.cache
+
+    def tearDown(self):
+        auth.jwks_store = self.original_store
+        auth.token_cache = self.original_cache
+
+    def get(self, token):
+        return self.client.get('/actors', headers={'Authorization': f'Bearer {token}'})
+
+    def test_repeated_token_is_verified_once(self):
+        token = self.signer.token(['get:actors'])
+        with patch('auth.verify_decode_jwt', wraps=auth.verify_decode_jwt) as verify:
+            for _ in range(3):
+                self.assertEqual(self.get(token).status_code, 200)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_cached_permissions_are_checked(self):
+        token = self.signer.token(['get:movies'])
+        self.assertEqual(self.get(token).status_code, 403)
+        self.assertEqual(self.get(token).status_code, 403)
+        self.assertIsInstance(self.cache.get(token)['permissions'], frozenset)
+
+    def test_entry_expires_with_token(self):
+        token = self.signer.token(['get:actors'], expires_in=60)
+        self.assertEqual(self.get(token).status_code, 200)
+        with patch('auth.time.time', return_value=time.time() + 120):
+            self.assertIsNone(self.cache.get(token))
+            with patch('auth.verify_decode_jwt', side_effect=AuthError({}, 401)) as verify:
+                self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(verify.call_count, 1)
+
+    def test_cache_is_bounded(self):
+        tokens = [self.signer.token(['get:actors'], expires_in=60 + i)
+                  for i in range(3)]
+        for token in tokens:
+            self.get(token)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(tokens[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()